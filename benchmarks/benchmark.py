@@ -0,0 +1,366 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../src"))
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None  # type: ignore
+
+from pathlib import Path
+from typing import Any, Callable, Optional
+from app.libs.flex import Flexmeta, Flextable
+
+STATUSES = ["INFO", "DEBUG", "WARNING", "ERROR"]
+SERVICES = ["api", "auth", "billing", "search", "mailer"]
+FIRST_NAMES = ["juan", "mary", "ana", "paul", "lea", "omar", "yuki", "ivan"]
+LAST_NAMES = ["green", "mann", "alvarez", "smith", "dupont", "kim", "rossi"]
+DOMAINS = ["gmail.com", "yahoo.com", "hotmail.com", "example.org"]
+STORAGE = "segment"
+
+
+class Contact:
+    def __init__(self):
+        self.mail: str = ""
+
+
+class Person(Flextable):
+    def __init__(self):
+        super().__init__(Flexmeta(self, "bench_persons", storage=STORAGE))
+        self.name: str = ""
+        self.birth_year: int = 0
+        self.tags: list = []
+        self.contact: Contact = Contact()
+
+    def actual_age(self) -> int:
+        return 2025 - self.birth_year
+
+
+class Log(Flextable):
+    def __init__(self):
+        super().__init__(Flexmeta(self, "bench_logs", storage=STORAGE))
+        self.date: str = ""
+        self.status: str = ""
+        self.service: str = ""
+        self.person_id: int = 0
+        self.message: str = ""
+
+
+def percentiles(latencies: list[float]) -> dict[str, Any]:
+    values = sorted(latencies)
+
+    def at(ratio: float) -> float:
+        return values[min(len(values) - 1, int(ratio * len(values)))]
+
+    return {
+        "n": len(values),
+        "min": values[0],
+        "p50": at(0.5),
+        "p90": at(0.9),
+        "p99": at(0.99),
+        "max": values[-1],
+        "mean": sum(values) / len(values),
+    }
+
+
+def measure(
+    function: Callable[[], Any],
+    repeat: int,
+    setup: Optional[Callable[[], Any]] = None,
+) -> dict[str, Any]:
+    latencies: list[float] = []
+
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+
+        start = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - start)
+
+    return percentiles(latencies)
+
+
+def peak_rss_kb() -> Optional[int]:
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # bytes on macOS, kilobytes on Linux
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def generate(size: int, chunk_size: int = 10000) -> dict[str, Any]:
+    """Inserts `size` persons and `size` logs by batches, and returns the insert throughput"""
+    rng = random.Random(size)
+    start = time.perf_counter()
+
+    for offset in range(0, size, chunk_size):
+        with Person().flexmeta.batch():
+            for _ in range(min(chunk_size, size - offset)):
+                person = Person()
+                person.name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+                person.birth_year = rng.randint(1940, 2015)
+                person.tags = rng.sample(["a", "b", "c", "d"], rng.randint(0, 3))
+                person.contact.mail = (
+                    f"{person.name.replace(' ', '.')}@{rng.choice(DOMAINS)}"
+                )
+                person.commit()
+
+    persons = time.perf_counter() - start
+    start = time.perf_counter()
+
+    for offset in range(0, size, chunk_size):
+        with Log().flexmeta.batch():
+            for _ in range(min(chunk_size, size - offset)):
+                log = Log()
+                log.date = f"2025-06-{rng.randint(1, 30):02d}"
+                log.status = rng.choice(STATUSES)
+                log.service = rng.choice(SERVICES)
+                log.person_id = rng.randint(1, size)
+                log.message = f"request {rng.randint(0, 10**6)} done"
+                log.commit()
+
+    logs = time.perf_counter() - start
+
+    return {
+        "persons_rows_per_s": size / persons,
+        "logs_rows_per_s": size / logs,
+    }
+
+
+def statements() -> dict[str, Callable[[Flextable.Flexselect], Any]]:
+    """One predicate per Statement operator, on a Person select"""
+    return {
+        "eq": lambda s: s.birth_year == 1980,
+        "ne": lambda s: s.birth_year != 1980,
+        "lt": lambda s: s.birth_year < 1950,
+        "le": lambda s: s.birth_year <= 1950,
+        "gt": lambda s: s.birth_year > 2010,
+        "ge": lambda s: s.birth_year >= 2010,
+        "is_true": lambda s: s.tags.is_true(),
+        "is_false": lambda s: s.tags.is_false(),
+        "is_null": lambda s: s.name.is_null(),
+        "is_not_null": lambda s: s.name.is_not_null(),
+        "is_empty": lambda s: s.tags.is_empty(),
+        "is_not_empty": lambda s: s.tags.is_not_empty(),
+        "is_between": lambda s: s.birth_year.is_between((1970, 1975)),
+        "is_not_between": lambda s: s.birth_year.is_not_between((1950, 2005)),
+        "is_in": lambda s: s.birth_year.is_in([1960, 1970, 1980]),
+        "is_not_in": lambda s: s.birth_year.is_not_in(list(range(1941, 2015))),
+        "is_intersect": lambda s: s.tags.is_intersect(["a"]),
+        "is_not_intersect": lambda s: s.tags.is_not_intersect(["a", "b"]),
+        "is_full_intersect": lambda s: s.tags.is_full_intersect(["a", "b"]),
+        "is_not_full_intersect": lambda s: s.tags.is_not_full_intersect(["a"]),
+        "prefix": lambda s: s.name.prefix("mary"),
+        "not_prefix": lambda s: s.name.not_prefix("m"),
+        "suffix": lambda s: s["contact.mail"].suffix("@gmail.com"),
+        "not_suffix": lambda s: s["contact.mail"].not_suffix(".com"),
+        "contains": lambda s: s.name.contains("an a"),
+        "not_contains": lambda s: s.name.not_contains("a"),
+        "method": lambda s: s.actual_age() >= 80,
+    }
+
+
+def run(size: int, repeat: int, root: str) -> dict[str, Any]:
+    results: dict[str, Any] = {}
+    Flexmeta.setPath(Path(root))
+    shutil.rmtree(Flexmeta.RootPath, ignore_errors=True)
+
+    results["generate"] = generate(size)
+
+    # single commits rewrite the journal, so they are measured on updates
+    rng = random.Random(0)
+    persons = Person().flexmeta
+    updates = [persons.load_object(rng.randint(1, size)) for _ in range(repeat * 10)]
+    updates = [person for person in updates if person is not None]
+    results["commit"] = measure(lambda: updates.pop().commit(), len(updates))
+
+    results["load_all_cold"] = measure(
+        persons.load_all, repeat, lambda: Flexmeta.evict_select(persons.uniqid)
+    )
+    results["load_all_warm"] = measure(persons.load_all, repeat)
+    results["select_hydration"] = measure(lambda: Person().select().fetch_all(), repeat)
+
+    for name, statement in statements().items():
+
+        def query(statement=statement):
+            select = Person().select()
+            select.where(statement(select))
+            return select.count()
+
+        results[f"where_{name}"] = measure(query, repeat)
+
+    def where_or():
+        select = Person().select()
+        select.where(select.birth_year < 1950, select.name.prefix("mary"))
+        return select.count()
+
+    results["where_or"] = measure(where_or, repeat)
+    results["sort"] = measure(
+        lambda: Person().select().sort("birth_year").fetch_all(), repeat
+    )
+    results["sort_limit"] = measure(
+        lambda: Person().select().sort("birth_year", True).limit(20).fetch_all(),
+        repeat,
+    )
+    results["paginate"] = measure(
+        lambda: Person().select().paginate(max(1, size // 40), 20), repeat
+    )
+
+    def join(how: str) -> Callable[[], Any]:
+        def query():
+            select = Person().select()
+            select.where(select.birth_year == 1980)
+            logs = Log().select()
+            logs.where(logs.status == "ERROR")
+            getattr(select, f"{how}_join")("logs", logs, "person_id", many=True)
+            return select.count()
+
+        return query
+
+    results["left_join"] = measure(join("left"), repeat)
+    results["union_join"] = measure(join("union"), repeat)
+
+    def distinct():
+        select = Person().select()
+        select.distinct("birth_year")
+        return select.count()
+
+    results["distinct"] = measure(distinct, repeat)
+    results["peak_rss_kb"] = peak_rss_kb()
+
+    return results
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], threshold: float) -> int:
+    """Prints the p50 ratios against a previous run, and returns the number of regressions"""
+    regressions = 0
+
+    for size, benchmarks in results["results"].items():
+        previous = baseline.get("results", {}).get(size, {})
+
+        for name, stats in benchmarks.items():
+            if not isinstance(stats, dict) or "p50" not in stats:
+                continue
+            if not isinstance(old := previous.get(name), dict) or not old.get("p50"):
+                continue
+
+            ratio = stats["p50"] / old["p50"]
+            flag = ""
+
+            if ratio > 1 + threshold:
+                regressions += 1
+                flag = " REGRESSION"
+
+            print(
+                f"{size:>10} {name:<28} {old['p50']:>10.5f} {stats['p50']:>10.5f} {ratio:>6.2f}x{flag}"
+            )
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flex benchmarks")
+    parser.add_argument(
+        "--sizes", default="10000,100000", help="e.g. 10000,100000,1000000,10000000"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--root", default="", help="directory of the generated tables")
+    parser.add_argument(
+        "--output", default="", help="writes the results to this JSON file"
+    )
+    parser.add_argument("--compare", default="", help="JSON results of a previous run")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--size", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.size:
+        # worker: one process per size, so that the peak RSS is its own
+        print(json.dumps(run(args.size, args.repeat, args.root)))
+        return
+
+    root = args.root or tempfile.mkdtemp(prefix="flexbench")
+    results: dict[str, Any] = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "storage": STORAGE,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        results["meta"]["commit"] = revision.stdout.strip()
+    except OSError:
+        pass
+
+    try:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            print(f"running {size} rows...", file=sys.stderr)
+            worker = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--size",
+                    str(size),
+                    "--repeat",
+                    str(args.repeat),
+                    "--root",
+                    root,
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            results["results"][str(size)] = json.loads(worker.stdout)
+    finally:
+        if not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+    for size, benchmarks in results["results"].items():
+        print(f"\n{size} rows (peak RSS {benchmarks['peak_rss_kb']} KB)")
+
+        for name, rate in benchmarks["generate"].items():
+            print(f"  {name:<28} {rate:>12.0f}")
+
+        for name, stats in benchmarks.items():
+            if isinstance(stats, dict) and "p50" in stats:
+                print(
+                    f"  {name:<28} p50={stats['p50']:.5f}s p90={stats['p90']:.5f}s p99={stats['p99']:.5f}s"
+                )
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+
+        print()
+
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -31,8 +31,8 @@ class Person(Flextable):
 
 Flexmeta.setPath(Path("../src"))
 
-## uncomment code below to generate data
-# with open('./persons.json') as handle:
+## uncomment code below to generate data (written at once by the batch)
+# with open('./persons.json') as handle, Person().flexmeta.batch():
 #     for data in json.load(handle):
 #         person = Person()
 #         person.name = f'{data["name"]["last"]} {data["name"]["first"]}'
@@ -0,0 +1,53 @@
+import sys
+import time
+
+sys.path.append("../src")
+
+from pathlib import Path
+from app.libs.flex import Flexmeta, Flextable
+
+CODECS = ["pickle", "json", "marshal", "binary"]
+N_ROWS = 10000
+
+
+class Person(Flextable):
+    def __init__(self, codec: str = "pickle"):
+        super().__init__(Flexmeta(self, f"codecs_{codec}", 0, -1, codec=codec))
+        self.name: str = ""
+        self.birth_year: int = 0
+        self.mail: str = ""
+        self.tags: list = []
+
+
+Flexmeta.setPath(Path("../src"))
+
+# rows as they are stored: the dicts returned by on_dump()
+rows = []
+
+for i in range(N_ROWS):
+    person = Person()
+    person.id = i + 1
+    person.name = f"Person {i}"
+    person.birth_year = 1950 + i % 60
+    person.mail = f"person.{i}@example.com"
+    person.tags = ["flex", i % 7]
+    rows.append(person.on_dump())
+
+print(f"{'codec':<8} {'encode (ms)':>12} {'decode (ms)':>12} {'bytes/row':>10}")
+
+for name in CODECS:
+    codec = Person(name).flexmeta.store.codec
+
+    start = time.perf_counter()
+    encoded = [codec.encode(row) for row in rows]
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = [codec.decode(data) for data in encoded]
+    decode_time = time.perf_counter() - start
+
+    assert decoded == rows
+    size = sum(len(data) for data in encoded) / len(encoded)
+    print(
+        f"{name:<8} {encode_time * 1000:>12.1f} {decode_time * 1000:>12.1f} {size:>10.1f}"
+    )
@@ -1,15 +1,48 @@
 import os
+import sys
+import copy
 import json
 import glob
 import math
+import mmap
 import uuid
+import time
+import bisect
+import heapq
 import random
+import itertools
+import importlib
 import pickle
+import struct
+import marshal
+import asyncio
+import weakref
+import threading
+import multiprocessing
 
 from pathlib import Path
-from collections import namedtuple
-from typing import Any, Optional, Callable
-
+from operator import attrgetter
+from collections import namedtuple, OrderedDict
+from concurrent.futures import Executor
+from typing import (
+    Any,
+    Optional,
+    Callable,
+    Iterable,
+    Iterator,
+    AsyncIterator,
+    Sequence,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # type: ignore
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # type: ignore
 
 PaginateT = namedtuple("PaginateT", ["count", "pagination"])
 
@@ -47,9 +80,43 @@ class Flexmeta:
     RootPath: Path = Path("/app/src/flexstore")
     flextable_selects: dict[str, dict[int, dict[str, Any]]] = {}
     flexmeta_connections: dict[str, "Flexmeta"] = {}
+    flextable_prototypes: dict[str, "Flextable"] = {}
+    flextable_indexes: dict[str, dict[str, list["Flexmeta.Index"]]] = {}
+    flextable_versions: dict[str, int] = {}
+    flextable_stores: dict[str, "Flexmeta.ObjectStore | Flexmeta.SegmentStore"] = {}
+    flextable_batches: dict[str, "Flexmeta.Batch"] = {}
+    flextable_columns: dict[str, "Flexmeta.Columns"] = {}
+    flextable_arrays: dict[str, tuple[tuple, dict[Any, Any]]] = {}
+    flextable_partitions: dict[str, dict[Any, "Flexmeta"]] = {}
+    flextable_locks: dict[str, "Flexmeta.Lock"] = {}
+    flextable_stamps: dict[str, tuple[int, int, int]] = {}
+    flextable_news: dict[int, tuple[weakref.ref, int]] = {}
+    flextable_loads: dict[tuple, asyncio.Future] = {}
+    flextable_objects: dict[str, "Flexmeta.ObjectCache"] = {}
+    flextable_journals: dict[str, tuple[tuple[int, int, int], dict[str, Any]]] = {}
+    flextable_usages: OrderedDict[str, dict[str, Any]] = OrderedDict()
+    flextable_pins: set[str] = set()
+    executor: Optional[Executor] = None
+    delta_ratio: float = 0.1
+    object_cache_size: int = 1000
+    select_cache_rows: int = 0
+    select_cache_bytes: int = 0
+    select_hits: int = 0
+    select_misses: int = 0
+    select_evictions: int = 0
+    hooks: list[Callable[[str, dict[str, Any]], Any]] = []
 
     def __init__(
-        self, flextable: "Flextable", name: str, min_id: int = 0, max_size: int = -1
+        self,
+        flextable: "Flextable",
+        name: str,
+        min_id: int = 0,
+        max_size: int = -1,
+        indexes: dict[str, str | list[str]] = {},
+        storage: str = "object",
+        snapshot: str = "pickle",
+        partition: str = "",
+        codec: str = "pickle",
     ):
         self.flextable: "Flextable" = flextable
         self.name: str = os.path.basename(name)
@@ -57,16 +124,33 @@ class Flexmeta:
         self.uniqid: str = str(uuid.uuid5(uuid.NAMESPACE_OID, str(self.name_d)))
         self.min_id: int = min_id
         self.max_size: int = max_size
+        self.indexes: dict[str, list[str]] = {
+            path: [kinds] if isinstance(kinds, str) else list(kinds)
+            for path, kinds in indexes.items()
+        }
+        self.storage: str = storage
+        self.snapshot: str = snapshot
+        self.partition: str = partition
+        self.codec: str = codec
         journal: str = os.path.join(self.name_d, f"{self.name}.journal")
         self.journal: Flexmeta.Journal = Flexmeta.Journal(
             journal, self.flextable, min_id + 1
         )
-        self.journal.load()
+
+        if self.uniqid in Flexmeta.flextable_batches:
+            self.journal = Flexmeta.flextable_batches[self.uniqid].flexmeta.journal
+        else:
+            self.journal.load()
+
         Flexmeta.flexmeta_connections[self.uniqid] = self
 
     def __str__(self) -> str:
         return f'Flexmeta(name="{self.name}", flextable="{self.flextable.__class__.__name__}", max_size={self.max_size}, journal={self.journal})'
 
+    def __setstate__(self, state: dict[str, Any]):
+        self.__dict__.update(state)
+        Flexmeta.flexmeta_connections.setdefault(self.uniqid, self)
+
     @staticmethod
     def load(uniqid: str) -> "Flexmeta":
         if uniqid in Flexmeta.flexmeta_connections:
@@ -80,634 +164,4566 @@ class Flexmeta:
     def setPath(path: Path):
         Flexmeta.RootPath = path / "flexstore"
 
-    def count(self) -> int:
-        return self.journal.count
+    @staticmethod
+    def extract(item: dict[str, Any], path: str, defaults: dict[str, Any] = {}) -> Any:
+        """Reads a dotted path, the keys missing from the row dicts falling back to the prototype defaults"""
+        value: Any = item
+
+        for name in path.split("."):
+            if isinstance(value, dict):
+                value = value.get(name, default := defaults.get(name))
+                defaults = default if isinstance(default, dict) else {}
+            else:
+                value = getattr(value, name, None)
+                defaults = {}
 
-    def next_id(self) -> int:
-        return self.journal.next_id
+            if value is None:
+                return None
 
-    def has_commits(self) -> bool:
-        return len(self.journal.commits) > 0
+        return value
 
-    def path_to_object(self, selected_id: int) -> str:
-        return os.path.join(self.name_d, f"{selected_id}.object")
+    @staticmethod
+    def is_object(value: Any) -> bool:
+        """Tells if a value is a plain object, rebuilt from its class and its __dict__"""
+        klass = type(value)
+        return (
+            hasattr(value, "__dict__")
+            and klass.__module__ != "builtins"
+            and klass.__reduce_ex__ is object.__reduce_ex__
+            and klass.__reduce__ is object.__reduce__
+            and klass.__getstate__ is object.__getstate__
+            and not hasattr(klass, "__setstate__")
+        )
 
-    def is_object_exists(self, selected_id: int) -> bool:
-        return os.path.exists(self.path_to_object(selected_id))
+    @staticmethod
+    def stamp(filename: str) -> Optional[tuple[int, int, int]]:
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            return None
 
-    def load_object(self, selected_id: int) -> Optional["Flextable"]:
-        flextable: "Flextable" = self.flextable.clone()
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
 
-        if os.path.exists(filename := self.path_to_object(selected_id)):
-            with open(filename, "rb") as handle:
-                return flextable.clone(pickle.load(handle))
+    @staticmethod
+    def dump(filename: str, items: Any):
+        Flexmeta.replace(
+            filename,
+            lambda handle: pickle.dump(items, handle, protocol=pickle.HIGHEST_PROTOCOL),
+        )
 
-    def save_object(self, flextable: "Flextable") -> bool:
-        self.journal.load()
+    @staticmethod
+    def replace(filename: str, write: Callable[[Any], Any]):
+        """Writes to a temporary file, then replaces the file so that readers never see a partial write"""
+        temporary = f"{filename}.{os.getpid()}.tmp"
 
-        if not os.path.isdir(self.name_d):
-            os.umask(0)
-            os.makedirs(self.name_d, mode=0o777, exist_ok=True)
+        try:
+            with open(temporary, "wb") as handle:
+                write(handle)
 
-        if self.max_size > 0 and self.journal.count >= self.max_size:
-            return False
+            os.replace(temporary, filename)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+            raise
 
-        is_updated = os.path.exists(self.path_to_object(flextable.id))
+    @staticmethod
+    async def run(function: Callable[..., Any], *args: Any) -> Any:
+        """Runs a blocking function in Flexmeta.executor (the loop default executor if None)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(Flexmeta.executor, function, *args)
 
-        with open(self.path_to_object(flextable.id), "wb") as handle:
-            pickle.dump(flextable.on_dump(), handle, protocol=pickle.HIGHEST_PROTOCOL)
+    async def coalesce(
+        self, key: tuple, function: Callable[..., Any], *args: Any
+    ) -> Any:
+        """Runs a blocking function once for all the coroutines waiting on the same key"""
+        key = (self.uniqid, *key)
+        future = Flexmeta.flextable_loads.get(key)
 
-        if is_updated:
-            self.journal.commits.append(("UPDATED", flextable.id))
-        else:
-            self.journal.count += 1
-            self.journal.next_id += 1
-            self.journal.commits.append(("INSERTED", flextable.id))
+        if future is None or future.get_loop() is not asyncio.get_running_loop():
+            future = asyncio.ensure_future(Flexmeta.run(function, *args))
+            Flexmeta.flextable_loads[key] = future
 
-        return self.journal.save()
+            def done(_: asyncio.Future):
+                if Flexmeta.flextable_loads.get(key) is future:
+                    del Flexmeta.flextable_loads[key]
 
-    def delete_object(self, selected_id: int) -> bool:
-        self.journal.load()
+            future.add_done_callback(done)
 
-        if os.path.exists(filename := self.path_to_object(selected_id)):
-            os.unlink(filename)
-            self.journal.count -= 1
-            self.journal.commits.append(("DELETED", selected_id))
-            return self.journal.save()
+        return await asyncio.shield(future)
 
-        return False
+    @staticmethod
+    def register(flextable: "Flextable"):
+        key = id(flextable)
 
-    def load_all(self) -> dict[int, dict[str, Any]]:
-        self.journal.load()
-        items: dict[int, dict[str, Any]] = {}
-        select = os.path.join(self.name_d, f"{self.name}.select")
+        def forget(_: weakref.ref):
+            Flexmeta.flextable_news.pop(key, None)
 
-        if not self.has_commits() and os.path.exists(select):
-            if self.uniqid not in Flexmeta.flextable_selects:
-                with open(select, "rb") as handle:
-                    Flexmeta.flextable_selects[self.uniqid] = pickle.load(handle)
+        Flexmeta.flextable_news[key] = (weakref.ref(flextable, forget), flextable.id)
 
-            return Flexmeta.flextable_selects[self.uniqid]
-        elif self.has_commits() and self.uniqid in Flexmeta.flextable_selects:
-            items = Flexmeta.flextable_selects[self.uniqid]
-
-            for what, selected_id in self.journal.commits:
-                if what == "DELETED":
-                    del items[selected_id]
-                elif what in ["INSERTED", "UPDATED"]:
-                    if os.path.exists(temp := self.path_to_object(selected_id)):
-                        with open(temp, "rb") as handle:
-                            if isinstance(n_item := pickle.load(handle), dict):
-                                items[selected_id] = n_item
-        else:
-            for temp in sorted(glob.glob(os.path.join(self.name_d, "*.object"))):
-                if os.path.exists(temp):
-                    with open(temp, "rb") as handle:
-                        if isinstance(item := pickle.load(handle), dict):
-                            items[item["id"]] = item
+    @staticmethod
+    def is_new(flextable: "Flextable") -> bool:
+        """Tells if a flextable was created in this process and never committed"""
+        if (new := Flexmeta.flextable_news.get(id(flextable))) is None:
+            return False
 
-        if os.path.isdir(self.name_d):
-            with open(select, "wb") as handle:
-                pickle.dump(items, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        return new[0]() is flextable and new[1] == flextable.id
 
-        self.journal.count = len(items)
-        self.journal.commits = []
-        self.journal.save()
-        Flexmeta.flextable_selects[self.uniqid] = items
+    @staticmethod
+    def scan_partitions(
+        partitions: list["Flexmeta"],
+        query: "Flextable.Flexselect.Expression | Callable[[Flextable.Flexselect], Any]",
+        ids: bool = False,
+        processes: Optional[int] = None,
+    ) -> Iterator[dict[str, Any] | int]:
+        """Runs a query on each partition in a process pool and yields the matching rows (or ids)"""
+        tasks = [(flexmeta, query, ids) for flexmeta in partitions]
+
+        if len(tasks) < 2 or processes == 1:
+            for task in tasks:
+                yield from Flexmeta.scan_partition(task)
+            return
+
+        with multiprocessing.Pool(
+            min(processes or os.cpu_count() or 1, len(tasks))
+        ) as pool:
+            for rows in pool.imap(Flexmeta.scan_partition, tasks):
+                yield from rows
 
-        return Flexmeta.flextable_selects[self.uniqid]
+    @staticmethod
+    def scan_partition(task: tuple) -> list[dict[str, Any] | int]:
+        flexmeta, query, ids = task
+        select = flexmeta.select()
 
-    class Journal:
-        def __init__(self, filename: str, flextable: "Flextable", next_id: int):
-            self.filename: str = filename
-            self.classname: str = flextable.__class__.__name__
-            self.count: int = 0
-            self.next_id: int = next_id
-            self.commits: list[tuple[str, int]] = []
+        if isinstance(query, Flextable.Flexselect.Expression):
+            select.where(query)
+        else:
+            query(select)
 
-        def __str__(self) -> str:
-            return f"Flexmeta.Journal(count={self.count}, next_id={self.next_id})"
+        if ids:
+            return select.compact()
 
-        def load(self) -> bool:
-            if os.path.exists(self.filename):
-                with open(self.filename, "rb") as handle:
-                    if isinstance(items := pickle.load(handle), dict):
-                        self.count = items["count"]
-                        self.next_id = items["next_id"]
-                        self.classname = items["classname"]
-                        self.commits = items["commits"]
+        if select.columns is not None:
+            return [select.columns.row(record) for record in select.records]
 
-                return True
-            return False
+        return [select.hydrate(record).on_dump() for record in select.records]
 
-        def save(self) -> bool:
-            if os.path.isdir(os.path.dirname(self.filename)):
-                with open(self.filename, "wb") as handle:
-                    journal = {
-                        "count": self.count,
-                        "next_id": self.next_id,
-                        "classname": self.classname,
-                        "commits": self.commits,
-                    }
-                    pickle.dump(journal, handle)
+    def select(
+        self, flextable: Optional["Flextable"] = None, chunk_size: int = 0
+    ) -> "Flextable.Flexselect":
+        indexes: dict[str, list[Flexmeta.Index]] = {}
+        flextable = self.flextable if flextable is None else flextable
 
-                return True
-            return False
+        if chunk_size > 0:
+            n_select = Flextable.Flexselect(flextable, flexmeta=self)
+            n_select.chunk_size = chunk_size
 
+            return n_select
 
-class Flextable(
-    metaclass=protect(
-        "flexmeta", "_load", "prop", "clone", "commit", "delete", "select"
-    ),
-):
-    def __init__(self, flexmeta: Flexmeta):
-        self._flexmeta_uniqid_: str = flexmeta.uniqid
-        self.id: int = flexmeta.next_id()
-        self.uniqid: str = str(uuid.uuid5(uuid.NAMESPACE_OID, str(self.id)))
+        if self.partition:
+            n_select = Flextable.Flexselect(flextable, flexmeta=self)
+            n_select.partitions = list(self.get_partitions())
 
-    def __getitem__(self, name: str) -> Any:
-        return self.prop(name)
+            return n_select
 
-    def __str__(self) -> str:
-        return f"{self.__class__.__name__}(flexmeta={self.flexmeta})"
+        if self.snapshot == "columnar":
+            columns = self.load_columns()
+            stamp: Any = columns.stamp
 
-    def __hash__(self) -> int:
-        return hash(self.uniqid)
+            if type(flextable).on_load is Flextable.on_load:
+                indexes = self.get_indexes()
 
-    @property
-    def flexmeta(self) -> Flexmeta:
-        return Flexmeta.load(self._flexmeta_uniqid_)
+            n_select = Flextable.Flexselect(flextable, [], indexes, columns, self)
+        else:
+            items = list(self.load_all().values())
+            stamp = Flexmeta.flextable_stamps.get(self.uniqid)
 
-    @staticmethod
-    def _load(flextable: "Flextable", selected_id: int) -> Optional["Flextable"]:
-        return flextable.flexmeta.load_object(selected_id)
+            if type(flextable).on_load is Flextable.on_load:
+                indexes = self.get_indexes()
 
-    def prop(self, name: str, args: list | tuple | dict = ()) -> Any:
-        o: Flextable | object = self
-        value: Any = None
+            n_select = Flextable.Flexselect(flextable, items, indexes, flexmeta=self)
 
-        for tname in name.split("."):
-            if value := getattr(o, tname):
-                if isinstance(value, object):
-                    o = value
-            else:
-                return value
+        n_select.arrays = self.get_arrays(stamp)
 
-        if callable(value):
-            if isinstance(args, dict):
-                return value(**args)
+        return n_select
 
-            return value(*args)
+    async def aselect(
+        self, flextable: Optional["Flextable"] = None, chunk_size: int = 0
+    ) -> "Flextable.Flexselect":
+        if chunk_size <= 0 and not self.partition:
+            if self.snapshot == "columnar":
+                await self.coalesce(("columns",), self.load_columns)
+            else:
+                await self.coalesce(("select",), self.load_all)
 
-        return value
+        return await Flexmeta.run(self.select, flextable, chunk_size)
 
-    def clone(self, items: dict = {}) -> "Flextable":
-        flextable = type(self)()  # type: ignore
+    def chunks(self, chunk_size: int = 1000) -> Iterator[list[dict[str, Any]]]:
+        """Reads the rows by chunks, without loading the whole table in memory"""
+        chunk: list[dict[str, Any]] = []
 
-        if items and isinstance(items, dict):
-            return flextable.on_load(items)
+        if self.partition:
+            for partition in self.partitions():
+                yield from partition.chunks(chunk_size)
+            return
 
-        return flextable
+        self.journal.load()
 
-    def commit(self) -> bool:
-        return self.flexmeta.save_object(self)
+        if self.has_commits() or not os.path.exists(self.path_to_select()):
+            rows: Iterator[dict[str, Any]] = self.store.scan()
+        elif self.is_select_cached() and (
+            items := Flexmeta.flextable_selects.get(self.uniqid)
+        ):
+            rows = iter(list(items.values()))
+        elif self.snapshot == "columnar":
+            columns = self.get_columns()
+            rows = (columns.row(position) for position in range(columns.count))
+        else:
+            rows = self.store.scan()
 
-    def delete(self) -> bool:
-        return self.flexmeta.delete_object(self.id)
+        for row in rows:
+            chunk.append(row)
 
-    def select(self) -> "Flextable.Flexselect":
-        return Flextable.Flexselect(self, list(self.flexmeta.load_all().values()))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
 
-    def to_json(self, indent: Optional[int] = None) -> str:
-        def default(o: object) -> Any:
-            try:
-                return o.__dict__
-            except Exception:
-                return str(o)
+        if chunk:
+            yield chunk
 
-        return json.dumps(self.on_dump(), indent=indent, default=default)
+    def prototype(self) -> "Flextable":
+        if self.uniqid not in Flexmeta.flextable_prototypes:
+            Flexmeta.flextable_prototypes[self.uniqid] = type(self.flextable)()  # type: ignore
 
-    def on_dump(self) -> dict[str, Any]:
-        items: dict[str, Any] = {}
+        return Flexmeta.flextable_prototypes[self.uniqid]
 
-        for k, v in self.__dict__.items():
-            if isinstance(v, Flextable) and v != self:
-                items[k] = v.on_dump()
-            else:
-                items[k] = v
+    def defaults(self) -> dict[str, Any]:
+        """Returns a new row as it is stored, whose values fill the attributes missing from older rows"""
+        return self.prototype().on_dump()
 
-        return items
+    def count(self) -> int:
+        return self.journal.count
 
-    def on_load(self, items: dict) -> "Flextable":
-        for k, v in [(k, v) for k, v in self.__dict__.items() if k in items]:
-            if isinstance(v, Flextable) and v != self:
-                setattr(self, k, v.on_load(items[k]))
-            else:
-                setattr(self, k, items[k])
+    def next_id(self) -> int:
+        return self.journal.next_id
 
-        return self
+    def has_commits(self) -> bool:
+        return len(self.journal.commits) > 0
 
-    class Flexselect:
-        def __init__(self, flextable: "Flextable", items: list[dict[str, Any]] = []):
-            self.flextable: Flextable = flextable
-            self.items: list[Flextable] = list(
-                map(lambda item: flextable.clone(item), items)
-            )
+    def path_to_object(self, selected_id: int) -> str:
+        return os.path.join(self.name_d, f"{selected_id}.object")
 
-        def __getattr__(self, name: str) -> "Flextable.Flexselect.Statement":
-            return Flextable.Flexselect.Statement(self.items, name)
+    def path_to_select(self) -> str:
+        if self.snapshot == "columnar":
+            return os.path.join(self.path_to_columns(), "meta")
 
-        def __getitem__(self, name: str) -> "Flextable.Flexselect.Statement":
-            return Flextable.Flexselect.Statement(self.items, name)
+        return os.path.join(self.name_d, f"{self.name}.select")
 
-        def __len__(self) -> int:
-            return len(self.items)
+    def path_to_delta(self) -> str:
+        return os.path.join(self.name_d, f"{self.name}.delta")
 
-        def __iter__(self):
-            for item in self.items:
-                yield item
+    def path_to_columns(self) -> str:
+        return os.path.join(self.name_d, f"{self.name}.columns")
 
-        def empty(self):
-            self.items = []
+    def path_to_indexes(self) -> str:
+        return os.path.join(self.name_d, f"{self.name}.index")
 
-        def shuffle(self):
-            random.shuffle(self.items)
+    def path_to_partitions(self) -> str:
+        return os.path.join(self.name_d, f"{self.name}.partitions")
 
-        def count(self) -> int:
-            return len(self.items)
+    def get_partitions(self) -> dict[Any, str]:
+        if os.path.exists(filename := self.path_to_partitions()):
+            with open(filename, "rb") as handle:
+                return pickle.load(handle)
+
+        return {}
+
+    def get_partition(self, value: Any) -> "Flexmeta":
+        partitions = Flexmeta.flextable_partitions.setdefault(self.uniqid, {})
+
+        if value not in partitions:
+            if (dirname := str(value)) in ["", ".", ".."] or os.sep in dirname:
+                raise Exception(
+                    f"Flexmeta partition '{dirname}' is not a valid directory name: {self.name}"
+                )
+
+            partitions[value] = Flexmeta(
+                self.flextable,
+                os.path.join(self.name_d, dirname),
+                self.min_id,
+                -1,
+                self.indexes,
+                self.storage,
+                self.snapshot,
+                codec=self.codec,
+            )
 
-        def compact(self, name: str = "") -> list[int | Any]:
-            if not name:
-                return [item.id for item in self.items]
+        return partitions[value]
 
-            return [item.prop(name) for item in self.items]
+    def partitions(self) -> list["Flexmeta"]:
+        return [self.get_partition(value) for value in self.get_partitions()]
 
-        def compact_dict(
-            self, name: str | list[str] = ""
-        ) -> dict[int | str, "Flextable"]:
-            if not name:
-                return {item.id: item for item in self.items}
+    def find_partition(self, selected_id: int) -> Optional["Flexmeta"]:
+        for partition in self.partitions():
+            if partition.store.exists(selected_id):
+                return partition
 
-            if isinstance(name, str):
-                name = [name]
+    @property
+    def store(self) -> "Flexmeta.ObjectStore | Flexmeta.SegmentStore":
+        stores = {"object": Flexmeta.ObjectStore, "segment": Flexmeta.SegmentStore}
 
-            return {
-                "_".join([str(item.prop(n)) for n in name]): item for item in self.items
-            }
+        if self.storage not in stores:
+            raise Exception(f"Flexmeta storage '{self.storage}' is not supported")
 
-        def distinct(self, name: str | list[str] = ""):
-            self.items = list(self.compact_dict(name).values())
+        store = Flexmeta.flextable_stores.get(self.uniqid)
 
-        def map(
-            self, callback: Callable[["Flextable"], "Flextable"]
-        ) -> "Flextable.Flexselect":
-            if callable(callback):
-                self.items = list(map(callback, self.items))
+        if (
+            not isinstance(store, stores[self.storage])
+            or store.codec.name != self.codec
+        ):
+            store = stores[self.storage](self.name_d, self.name, self.get_codec())
+            Flexmeta.flextable_stores[self.uniqid] = store
 
-            return self
+        return store
 
-        def where(self, *statements: list["Flextable"]):
-            self.items = []
+    def get_codec(self) -> "Flexmeta.Codec":
+        codecs = {
+            "pickle": Flexmeta.PickleCodec,
+            "json": Flexmeta.JsonCodec,
+            "marshal": Flexmeta.MarshalCodec,
+            "binary": Flexmeta.BinaryCodec,
+        }
 
-            for items in statements:
-                if isinstance(items, list):
-                    self.items.extend(item for item in items if item not in self.items)
+        if self.codec not in codecs:
+            raise Exception(f"Flexmeta codec '{self.codec}' is not supported")
 
-        def sort(self, name: str, desc: bool = False):
-            self.items = sorted(
-                self.items, key=lambda item: item.prop(name), reverse=desc
-            )
+        return codecs[self.codec](self.name_d, self.name)
 
-        def find(self, selected_id: int) -> Optional["Flextable"]:
-            return self.compact_dict().get(selected_id, None)
+    def is_object_exists(self, selected_id: int) -> bool:
+        if self.partition:
+            return self.find_partition(selected_id) is not None
 
-        def fetch_one(self) -> Optional["Flextable"]:
-            for item in self.items:
-                return item
+        return self.store.exists(selected_id)
 
-        def fetch_all(self) -> list["Flextable"]:
-            return self.items
+    def load_object(self, selected_id: int) -> Optional["Flextable"]:
+        if (item := self.read_object(selected_id)) is not None:
+            return self.flextable.clone(item)
 
-        def paginate(
-            self, current: int = 0, items_per_page: int = 10, nb_buttons: int = 11
-        ) -> PaginateT:
-            buttons: list[int] = []
-            paginations: list[tuple[int, str, bool]] = []
-            total_item = self.count()
+    async def aload_object(self, selected_id: int) -> Optional["Flextable"]:
+        item = await self.coalesce(
+            ("object", selected_id), self.read_object, selected_id
+        )
 
-            if current <= 0 or items_per_page <= 0 or total_item <= 0:
-                return PaginateT(total_item, paginations)
+        if item is not None:
+            # the coalesced item is shared by all the waiters
+            return self.flextable.clone(copy.deepcopy(item))
 
-            if current > (max_button := math.ceil(total_item / items_per_page)):
-                current = max_button
+    def read_object(self, selected_id: int) -> Optional[dict[str, Any]]:
+        if self.partition:
+            if (partition := self.find_partition(selected_id)) is not None:
+                return partition.read_object(selected_id)
 
-            if current < 1:
-                current = 1
+            return None
 
-            offset = abs((current * items_per_page) - items_per_page)
-            self.items = self.items[offset : offset + items_per_page]
+        cache = self.object_cache()
 
-            if nb_buttons >= max_button:
-                nb_buttons = max_button
+        if (data := cache.get(selected_id)) is None:
+            if (data := self.store.read_data(selected_id)) is None:
+                return None
 
-            if current <= nb_buttons / 2:
-                buttons = [i + 1 for i in range(0, nb_buttons)]
-            elif current > max_button - (nb_buttons / 2):
-                buttons = [i + 1 for i in range(max_button - nb_buttons, max_button)]
-            else:
-                buttons = [
-                    i + 1
-                    for i in range(
-                        current - math.ceil(nb_buttons / 2),
-                        current + math.floor(nb_buttons / 2),
-                    )
-                ]
+            cache.put(selected_id, data)
 
-            if not buttons:
-                return PaginateT(total_item, paginations)
+        return self.store.codec.decode(data)
 
-            for n in buttons:
-                paginations.append((n, str(n), n == current))
+    def object_cache(self) -> "Flexmeta.ObjectCache":
+        """Returns the cache of the encoded rows, without the rows committed since by other processes"""
+        if (cache := Flexmeta.flextable_objects.get(self.uniqid)) is None:
+            cache = Flexmeta.ObjectCache()
+            Flexmeta.flextable_objects[self.uniqid] = cache
 
-            if paginations[0][0] > 1:
-                paginations.insert(0, (1, "1 ... ", False))
+        if (stamp := Flexmeta.stamp(self.journal.filename)) != cache.stamp:
+            self.journal.load()
+            self.store.refresh()
+            cache.sync(stamp, self.journal.merged, self.journal.commits)
 
-            if paginations[-1][0] < max_button:
-                paginations.append((max_button, f" ... {max_button}", False))
+        return cache
 
-            return PaginateT(total_item, paginations)
+    def uncache_objects(self, ids: Iterable[int]):
+        if (cache := Flexmeta.flextable_objects.get(self.uniqid)) is not None:
+            cache.discard(ids)
 
-        def extend(self, select: "Flextable.Flexselect"):
-            self.items = list(set(select.items) | set(self.items))
+    def cache_stats(self) -> dict[str, int]:
+        if self.partition:
+            stats = [partition.cache_stats() for partition in self.partitions()]
+            return {
+                k: sum(n_stats[k] for n_stats in stats)
+                for k in Flexmeta.ObjectCache().stats()
+            }
 
-        def union_join(
-            self, name: str, select: "Flextable.Flexselect", using: str, on: str = ""
-        ) -> "Flextable.Flexselect":
-            left_table = self.compact_dict(on)
-            right_table = select.compact_dict(using)
-            self.items = []
+        return self.object_cache().stats()
 
-            for k, item in left_table.items():
-                if k in right_table:
-                    setattr(item, name, right_table[k])
-                else:
-                    setattr(item, name, None)
+    def batch(self) -> "Flexmeta.Batch":
+        return Flexmeta.Batch(self)
 
-                self.items.append(item)
+    def lock(self) -> "Flexmeta.Lock":
+        if self.uniqid not in Flexmeta.flextable_locks:
+            filename = os.path.join(self.name_d, f"{self.name}.lock")
+            Flexmeta.flextable_locks.setdefault(self.uniqid, Flexmeta.Lock(filename))
 
-            n_select = Flextable.Flexselect(
-                self.flextable, list(self.flextable.flexmeta.load_all().values())
-            ).compact_dict(on)
+        return Flexmeta.flextable_locks[self.uniqid]
 
-            for k, item in right_table.items():
-                if k not in left_table:
-                    n_item = n_select[k]
-                    setattr(n_item, name, item)
-                    self.items.append(n_item)
+    def save_object(self, flextable: "Flextable") -> bool:
+        if (batch := Flexmeta.flextable_batches.get(self.uniqid)) is not None:
+            return batch.add(flextable)
 
-            return self
+        n_flextables = [flextable] if Flexmeta.is_new(flextable) else []
 
-        def left_join(
-            self, name: str, select: "Flextable.Flexselect", using: str, on: str = ""
-        ) -> "Flextable.Flexselect":
-            left_table = self.compact_dict(on)
-            right_table = select.compact_dict(using)
-            self.items = []
+        if self.partition:
+            return self.save_partitions([flextable], n_flextables)
 
-            for k, item in left_table.items():
-                if k in right_table:
-                    setattr(item, name, right_table[k])
-                else:
-                    setattr(item, name, None)
+        return self.save_objects([flextable], n_flextables)
 
-                self.items.append(item)
+    def save_objects(
+        self, flextables: list["Flextable"], n_flextables: list["Flextable"] = []
+    ) -> bool:
+        if self.partition:
+            return self.save_partitions(flextables, n_flextables)
 
-            return self
+        if not os.path.isdir(self.name_d):
+            os.umask(0)
+            os.makedirs(self.name_d, mode=0o777, exist_ok=True)
 
-        class Statement:
-            def __init__(
-                self,
-                items: list["Flextable"],
-                name: str,
-                args: tuple | list | dict = (),
-            ):
-                self.name: str = name
-                self.args: tuple | list | dict = args
-                self.items: list["Flextable"] = items
+        with self.lock():
+            self.journal.load()
+            commits: list[tuple[str, int]] = []
+            items: list[tuple[int, dict[str, Any]]] = []
+            ids: dict[int, int] = {}
+            n_ids: dict[int, tuple[int, str]] = {}
+            news = {id(flextable) for flextable in n_flextables}
+            next_id, count = self.journal.next_id, self.journal.count
+
+            flextables = list(
+                {id(flextable): flextable for flextable in flextables}.values()
+            )
 
-            def __call__(self, *args, **kwargs):
-                self.args = args or kwargs
-                return self
+            for flextable in flextables:
+                if id(flextable) in news or flextable.id >= self.journal.next_id:
+                    ids[id(flextable)] = next_id
+                    commits.append(("INSERTED", next_id))
+                    next_id += 1
+                    count += 1
+                elif self.store.exists(flextable.id):
+                    commits.append(("UPDATED", flextable.id))
+                else:
+                    commits.append(("INSERTED", flextable.id))
+                    count += 1
 
-            def __eq__(self, value: Any) -> list["Flextable"]:  # type: ignore
-                return [e for e in self.items if e.prop(self.name, self.args) == value]
+            if self.max_size > 0 and count > self.max_size:
+                return False
 
-            def __ne__(self, value: Any) -> list["Flextable"]:  # type: ignore
-                return [e for e in self.items if e.prop(self.name, self.args) != value]
+            try:
+                for flextable in flextables:
+                    if id(flextable) in ids:
+                        n_ids[id(flextable)] = (flextable.id, flextable.uniqid)
+                        flextable.id = ids[id(flextable)]
+                        flextable.uniqid = str(
+                            uuid.uuid5(uuid.NAMESPACE_OID, str(flextable.id))
+                        )
 
-            def __lt__(self, value: Any) -> list["Flextable"]:
-                return [e for e in self.items if e.prop(self.name, self.args) < value]
+                    items.append((flextable.id, flextable.on_dump()))
 
-            def __gt__(self, value: Any) -> list["Flextable"]:
-                return [e for e in self.items if e.prop(self.name, self.args) > value]
+                self.store.write_many(items)
+                self.uncache_objects(selected_id for selected_id, _ in items)
+            except BaseException:
+                for flextable in flextables:
+                    if id(flextable) in n_ids:
+                        flextable.id, flextable.uniqid = n_ids[id(flextable)]
+                raise
 
-            def __le__(self, value: Any) -> list["Flextable"]:
-                return [e for e in self.items if e.prop(self.name, self.args) <= value]
+            for flextable in flextables:
+                Flexmeta.flextable_news.pop(id(flextable), None)
 
-            def __ge__(self, value: Any) -> list["Flextable"]:
-                return [e for e in self.items if e.prop(self.name, self.args) >= value]
+            self.journal.next_id, self.journal.count = next_id, count
+            self.journal.commits.extend(commits)
 
-            def is_true(self) -> list["Flextable"]:
-                return [e for e in self.items if e.prop(self.name, self.args) is True]
+            return self.journal.save()
 
-            def is_false(self) -> list["Flextable"]:
-                return [e for e in self.items if e.prop(self.name, self.args) is False]
+    def save_partitions(
+        self, flextables: list["Flextable"], n_flextables: list["Flextable"] = []
+    ) -> bool:
+        if not os.path.isdir(self.name_d):
+            os.umask(0)
+            os.makedirs(self.name_d, mode=0o777, exist_ok=True)
 
-            def is_null(self) -> list["Flextable"]:
-                return [e for e in self.items if e.prop(self.name, self.args) is None]
+        with self.lock():
+            self.journal.load()
+            groups: dict[Any, list["Flextable"]] = {}
+            moves: list[tuple[Flexmeta, int]] = []
+            ids: dict[int, int] = {}
+            n_ids: dict[int, tuple[int, str]] = {}
+            news = {id(flextable) for flextable in n_flextables}
+            next_id, count = self.journal.next_id, self.journal.count
+
+            flextables = list(
+                {id(flextable): flextable for flextable in flextables}.values()
+            )
 
-            def is_not_null(self) -> list["Flextable"]:
-                return [
-                    e for e in self.items if e.prop(self.name, self.args) is not None
-                ]
+            for flextable in flextables:
+                value = Flexmeta.extract(flextable, self.partition)  # type: ignore
+                partition = self.get_partition(value)
+                groups.setdefault(value, []).append(flextable)
 
-            def is_empty(self) -> list["Flextable"]:
-                return [
-                    e for e in self.items if e.prop(self.name, self.args) in [None, ""]
-                ]
+                if id(flextable) in news or flextable.id >= self.journal.next_id:
+                    ids[id(flextable)] = next_id
+                    next_id += 1
+                    count += 1
+                elif not partition.store.exists(flextable.id):
+                    if (previous := self.find_partition(flextable.id)) is not None:
+                        moves.append((previous, flextable.id))
+                    else:
+                        count += 1
 
-            def is_not_empty(self) -> list["Flextable"]:
-                return [
-                    e
-                    for e in self.items
-                    if e.prop(self.name, self.args) not in [None, ""]
-                ]
+            if self.max_size > 0 and count > self.max_size:
+                return False
 
-            def is_between(self, item: tuple[int, int]) -> list["Flextable"]:
-                return [
-                    e
-                    for e in self.items
-                    if (k := e.prop(self.name, self.args)) >= item[0] and k <= item[1]
-                ]
+            try:
+                for flextable in flextables:
+                    if id(flextable) in ids:
+                        n_ids[id(flextable)] = (flextable.id, flextable.uniqid)
+                        flextable.id = ids[id(flextable)]
+                        flextable.uniqid = str(
+                            uuid.uuid5(uuid.NAMESPACE_OID, str(flextable.id))
+                        )
 
-            def is_not_between(self, item: tuple[int, int]) -> list["Flextable"]:
-                return [
-                    e
-                    for e in self.items
-                    if not (
-                        (k := e.prop(self.name, self.args)) >= item[0] and k <= item[1]
-                    )
-                ]
+                for value, group in groups.items():
+                    self.get_partition(value).write_objects(group)
+            except BaseException:
+                for flextable in flextables:
+                    if id(flextable) in n_ids:
+                        flextable.id, flextable.uniqid = n_ids[id(flextable)]
+                raise
 
-            def is_in(self, pattern: list[Any]) -> list["Flextable"]:
-                return [
-                    e
-                    for e in self.items
-                    if e.prop(self.name, self.args) in set(pattern)
-                ]
+            for flextable in flextables:
+                Flexmeta.flextable_news.pop(id(flextable), None)
 
-            def is_not_in(self, pattern: list[Any]) -> list["Flextable"]:
-                return [
-                    e
-                    for e in self.items
-                    if e.prop(self.name, self.args) not in set(pattern)
-                ]
+            for partition, selected_id in moves:
+                partition.delete_object(selected_id)
 
-            def is_intersect(self, pattern: list[Any]) -> list["Flextable"]:
-                return [
-                    e
-                    for e in self.items
-                    if [p for p in set(pattern) if p in e.prop(self.name, self.args)]
-                ]
+            if not (partitions := self.get_partitions()).keys() >= groups.keys():
+                for value in groups:
+                    partitions.setdefault(value, str(value))
 
-            def is_not_intersect(self, pattern: list[Any]) -> list["Flextable"]:
-                return [
-                    e
-                    for e in self.items
-                    if [
-                        p for p in set(pattern) if p not in e.prop(self.name, self.args)
-                    ]
-                ]
+                Flexmeta.dump(self.path_to_partitions(), partitions)
 
-            def is_full_intersect(self, pattern: list[Any]) -> list["Flextable"]:
-                pattern = set(pattern)  # type: ignore
-                return [
-                    e
-                    for e in self.items
-                    if len([p for p in pattern if p in e.prop(self.name, self.args)])
-                    == len(pattern)
-                ]
+            self.journal.next_id, self.journal.count = next_id, count
 
-            def is_not_full_intersect(self, pattern: list[Any]) -> list["Flextable"]:
-                return [
-                    e
-                    for e in self.items
-                    if len(
-                        [p for p in set(pattern) if p in e.prop(self.name, self.args)]
+            return self.journal.save()
+
+    def write_objects(self, flextables: list["Flextable"]) -> bool:
+        if not os.path.isdir(self.name_d):
+            os.umask(0)
+            os.makedirs(self.name_d, mode=0o777, exist_ok=True)
+
+        with self.lock():
+            self.journal.load()
+            commits: list[tuple[str, int]] = []
+
+            for flextable in flextables:
+                if self.store.exists(flextable.id):
+                    commits.append(("UPDATED", flextable.id))
+                else:
+                    commits.append(("INSERTED", flextable.id))
+
+            self.store.write_many([(n.id, n.on_dump()) for n in flextables])
+            self.uncache_objects(n.id for n in flextables)
+            self.journal.count += sum(1 for what, _ in commits if what == "INSERTED")
+            self.journal.next_id = max(
+                [self.journal.next_id] + [i + 1 for _, i in commits]
+            )
+            self.journal.commits.extend(commits)
+
+            return self.journal.save()
+
+    def delete_object(self, selected_id: int) -> bool:
+        if self.partition:
+            if (partition := self.find_partition(selected_id)) is None:
+                return False
+
+            with self.lock():
+                if partition.delete_object(selected_id):
+                    self.journal.load()
+                    self.journal.count -= 1
+                    return self.journal.save()
+
+            return False
+
+        with self.lock():
+            self.journal.load()
+
+            if self.store.delete(selected_id):
+                self.uncache_objects([selected_id])
+                self.journal.count -= 1
+                self.journal.commits.append(("DELETED", selected_id))
+                return self.journal.save()
+
+        return False
+
+    def load_all(self) -> dict[int, dict[str, Any]]:
+        if self.partition:
+            return {
+                selected_id: item
+                for partition in self.partitions()
+                for selected_id, item in partition.load_all().items()
+            }
+
+        if self.snapshot == "columnar":
+            # the columns are the snapshot of a columnar table, its rows are not kept
+            return self.load_columns().rows()
+
+        if not os.path.isdir(self.name_d):
+            Flexmeta.flextable_selects.pop(self.uniqid, None)
+            Flexmeta.flextable_usages.pop(self.uniqid, None)
+            return {}
+
+        started = time.perf_counter()
+        self.journal.load()
+
+        # without commits to merge nothing is written, the snapshot is only read under a shared lock
+        if not self.has_commits() and os.path.exists(self.path_to_select()):
+            with self.lock().shared():
+                self.journal.load()
+
+                if not self.has_commits() and os.path.exists(self.path_to_select()):
+                    return self.load_select(started)
+
+        with self.lock():
+            self.journal.load()
+            items: dict[int, dict[str, Any]] = {}
+            select = self.path_to_select()
+            cached = self.is_select_cached()
+
+            if not self.has_commits() and os.path.exists(select):
+                return self.load_select(started)
+            elif self.has_commits() and os.path.exists(select):
+                if not cached:
+                    Flexmeta.flextable_selects[self.uniqid] = self.read_snapshot()
+
+                    if not self.has_indexes():
+                        self.load_indexes(Flexmeta.flextable_selects[self.uniqid])
+
+                items = Flexmeta.flextable_selects[self.uniqid]
+                indexes = sum(self.get_indexes().values(), [])
+                defaults = self.defaults()
+                replayed, bytes_read = time.perf_counter(), self.store.bytes_read
+                changes = self.read_commits()
+
+                for selected_id, n_item in changes.items():
+                    if n_item is None:
+                        items.pop(selected_id, None)
+
+                        for index in indexes:
+                            index.remove(selected_id)
+                    else:
+                        items[selected_id] = n_item
+
+                        for index in indexes:
+                            index.update(selected_id, n_item, defaults)
+
+                if Flexmeta.hooks:
+                    Flexmeta.emit(
+                        "replay",
+                        table=self.name_d,
+                        commits=len(self.journal.commits),
+                        bytes=self.store.bytes_read - bytes_read,
+                        seconds=time.perf_counter() - replayed,
+                    )
+
+                if os.path.isdir(self.name_d):
+                    self.write_delta(items, changes)
+            else:
+                cached = False
+                rebuilt, bytes_read = time.perf_counter(), self.store.bytes_read
+
+                for item in self.store.scan():
+                    items[item["id"]] = item
+
+                if Flexmeta.hooks:
+                    Flexmeta.emit(
+                        "rebuild",
+                        table=self.name_d,
+                        rows=len(items),
+                        bytes=self.store.bytes_read - bytes_read,
+                        seconds=time.perf_counter() - rebuilt,
+                    )
+
+                Flexmeta.flextable_indexes.pop(self.uniqid, None)
+
+                if os.path.isdir(self.name_d):
+                    self.write_snapshot(items)
+
+            self.journal.count = len(items)
+            self.journal.merged += len(self.journal.commits)
+            self.journal.commits = []
+            self.journal.save()
+            Flexmeta.flextable_selects[self.uniqid] = items
+            Flexmeta.flextable_stamps[self.uniqid] = self.stamp_select()
+            Flexmeta.flextable_versions[self.uniqid] = self.version() + 1
+
+            if not self.has_indexes():
+                self.load_indexes(items, rebuild=True)
+            elif not os.path.exists(self.path_to_delta()):
+                # a delta appended to the snapshot is replayed on the stored indexes when they are loaded
+                self.save_indexes()
+
+            self.touch_select(cached)
+
+            if Flexmeta.hooks:
+                Flexmeta.emit(
+                    "load_all",
+                    table=self.name_d,
+                    rows=len(items),
+                    cached=cached,
+                    seconds=time.perf_counter() - started,
+                )
+
+            return Flexmeta.flextable_selects[self.uniqid]
+
+    def load_select(self, started: float) -> dict[int, dict[str, Any]]:
+        """Returns the rows of a snapshot without commits to merge, read again only when another process rewrote it"""
+        if not (cached := self.is_select_cached()):
+            Flexmeta.flextable_selects[self.uniqid] = self.read_snapshot()
+            Flexmeta.flextable_stamps[self.uniqid] = self.stamp_select()
+            Flexmeta.flextable_versions[self.uniqid] = self.version() + 1
+
+        if not self.has_indexes():
+            self.load_indexes(Flexmeta.flextable_selects[self.uniqid])
+
+        self.touch_select(cached)
+
+        if Flexmeta.hooks:
+            Flexmeta.emit(
+                "load_all",
+                table=self.name_d,
+                rows=len(Flexmeta.flextable_selects[self.uniqid]),
+                cached=cached,
+                seconds=time.perf_counter() - started,
+            )
+
+        return Flexmeta.flextable_selects[self.uniqid]
+
+    def is_select_cached(self) -> bool:
+        """Tells if the cached rows match the snapshot, which another process may have rewritten"""
+        if self.uniqid not in Flexmeta.flextable_selects:
+            return False
+
+        return Flexmeta.flextable_stamps.get(self.uniqid) == self.stamp_select()
+
+    def touch_select(self, cached: bool = True):
+        """Marks the cached rows as recently used, then evicts the other tables over the budget"""
+        items = Flexmeta.flextable_selects[self.uniqid]
+        usage = Flexmeta.flextable_usages.get(self.uniqid)
+
+        if cached:
+            Flexmeta.select_hits += 1
+        else:
+            Flexmeta.select_misses += 1
+
+        if usage is None or not cached or usage["rows"] != len(items):
+            usage = {
+                "name": self.name_d,
+                "rows": len(items),
+                "bytes": Flexmeta.sizeof(items),
+            }
+            Flexmeta.flextable_usages[self.uniqid] = usage
+
+        Flexmeta.flextable_usages.move_to_end(self.uniqid)
+        Flexmeta.trim_selects()
+
+        if Flexmeta.hooks:
+            Flexmeta.emit(
+                "select_cache",
+                table=self.name_d,
+                hit=cached,
+                rows=usage["rows"],
+                bytes=usage["bytes"],
+            )
+
+    @staticmethod
+    def trim_selects():
+        """Evicts the least recently used tables, except the pinned and the last one, over the budget"""
+        usages = Flexmeta.flextable_usages
+        rows = sum(usage["rows"] for usage in usages.values())
+        size = sum(usage["bytes"] for usage in usages.values())
+
+        for uniqid in list(usages)[:-1]:
+            if (
+                Flexmeta.select_cache_rows <= 0 or rows <= Flexmeta.select_cache_rows
+            ) and (
+                Flexmeta.select_cache_bytes <= 0 or size <= Flexmeta.select_cache_bytes
+            ):
+                break
+
+            if uniqid in Flexmeta.flextable_pins:
+                continue
+
+            # a table being read by another thread is skipped, not waited for
+            lock = Flexmeta.flextable_locks.get(uniqid)
+
+            if lock is not None and not lock.mutex.acquire(blocking=False):
+                continue
+
+            try:
+                rows -= usages[uniqid]["rows"]
+                size -= usages[uniqid]["bytes"]
+                Flexmeta.evict_select(uniqid)
+            finally:
+                if lock is not None:
+                    lock.mutex.release()
+
+    @staticmethod
+    def evict_select(uniqid: str) -> bool:
+        """Drops the cached rows and indexes of a table, they are read again from the snapshot when needed"""
+        Flexmeta.flextable_usages.pop(uniqid, None)
+        Flexmeta.flextable_stamps.pop(uniqid, None)
+        Flexmeta.flextable_indexes.pop(uniqid, None)
+        Flexmeta.flextable_arrays.pop(uniqid, None)
+
+        if Flexmeta.flextable_selects.pop(uniqid, None) is None:
+            return False
+
+        Flexmeta.select_evictions += 1
+
+        return True
+
+    def evict(self) -> bool:
+        if self.partition:
+            return any([partition.evict() for partition in self.partitions()])
+
+        with self.lock():
+            return Flexmeta.evict_select(self.uniqid)
+
+    def pin(self):
+        """Keeps the cached rows of the table whatever the budget"""
+        if self.partition:
+            for partition in self.partitions():
+                partition.pin()
+
+        Flexmeta.flextable_pins.add(self.uniqid)
+
+    def unpin(self):
+        if self.partition:
+            for partition in self.partitions():
+                partition.unpin()
+
+        Flexmeta.flextable_pins.discard(self.uniqid)
+
+    @staticmethod
+    def select_stats() -> dict[str, Any]:
+        usages = Flexmeta.flextable_usages
+
+        return {
+            "tables": {
+                usage["name"]: {
+                    "rows": usage["rows"],
+                    "bytes": usage["bytes"],
+                    "pinned": uniqid in Flexmeta.flextable_pins,
+                }
+                for uniqid, usage in usages.items()
+            },
+            "rows": sum(usage["rows"] for usage in usages.values()),
+            "bytes": sum(usage["bytes"] for usage in usages.values()),
+            "hits": Flexmeta.select_hits,
+            "misses": Flexmeta.select_misses,
+            "evictions": Flexmeta.select_evictions,
+        }
+
+    @staticmethod
+    def emit(event: str, **data: Any):
+        """Calls the instrumentation hooks with an event name and its measures"""
+        for hook in list(Flexmeta.hooks):
+            hook(event, data)
+
+    @staticmethod
+    def profile() -> "Flexmeta.Profile":
+        return Flexmeta.Profile()
+
+    @staticmethod
+    def sizeof(items: dict[int, dict[str, Any]], samples: int = 100) -> int:
+        """Estimates the memory used by the rows from the first ones"""
+        rows = list(itertools.islice(items.values(), samples))
+
+        def size(value: Any, depth: int = 0) -> int:
+            n_size = sys.getsizeof(value)
+
+            if depth > 3:
+                return n_size
+            if isinstance(value, dict):
+                return n_size + sum(
+                    size(k, depth + 1) + size(v, depth + 1) for k, v in value.items()
+                )
+            if isinstance(value, (list, tuple, set)):
+                return n_size + sum(size(v, depth + 1) for v in value)
+            if hasattr(value, "__dict__") and not isinstance(value, type):
+                return n_size + size(value.__dict__, depth + 1)
+
+            return n_size
+
+        if not rows:
+            return sys.getsizeof(items)
+
+        return sys.getsizeof(items) + sum(size(row) for row in rows) * len(
+            items
+        ) // len(rows)
+
+    def read_snapshot(self) -> dict[int, dict[str, Any]]:
+        """Reads the snapshot and its delta, or only the end of the delta when the cached rows hold the rest"""
+        started = time.perf_counter()
+        codec = self.store.codec
+        stamp, n_stamp = Flexmeta.flextable_stamps.get(self.uniqid), self.stamp_select()
+        cached = Flexmeta.flextable_selects.get(self.uniqid)
+        indexes: list[Flexmeta.Index] = []
+
+        if (
+            cached is not None
+            and stamp is not None
+            and stamp[:2] == n_stamp[:2]
+            and stamp[2] <= n_stamp[2]
+        ):
+            # the indexes in memory follow the cached rows
+            items, offset, bytes_read = cached, stamp[2], 0
+            indexes = sum(self.get_indexes().values(), [])
+        else:
+            offset = 0
+            Flexmeta.flextable_indexes.pop(self.uniqid, None)
+
+            with open(self.path_to_select(), "rb") as handle:
+                items = next(codec.load(handle), {})  # type: ignore
+                bytes_read = handle.tell()
+
+        if os.path.exists(delta := self.path_to_delta()):
+            defaults = self.defaults()
+
+            with open(delta, "rb") as handle:
+                handle.seek(offset)
+
+                for changes in codec.load(handle):
+                    for selected_id, item in changes.items():
+                        if item is None:
+                            items.pop(selected_id, None)
+
+                            for index in indexes:
+                                index.remove(selected_id)
+                        else:
+                            items[selected_id] = item
+
+                            for index in indexes:
+                                index.update(selected_id, item, defaults)
+
+                bytes_read += handle.tell() - offset
+
+        if Flexmeta.hooks:
+            Flexmeta.emit(
+                "read_snapshot",
+                table=self.name_d,
+                rows=len(items),
+                bytes=bytes_read,
+                seconds=time.perf_counter() - started,
+            )
+
+        return items
+
+    def write_snapshot(self, items: dict[int, dict[str, Any]]):
+        codec = self.store.codec
+        Flexmeta.replace(self.path_to_select(), lambda h: codec.dump(h, items))
+
+        if os.path.exists(delta := self.path_to_delta()):
+            os.unlink(delta)
+
+        self.journal.deltas = 0
+
+    def write_delta(
+        self,
+        items: dict[int, dict[str, Any]],
+        changes: dict[int, Optional[dict[str, Any]]],
+    ):
+        deltas = self.journal.deltas + len(changes)
+
+        if deltas > len(items) * Flexmeta.delta_ratio:
+            return self.write_snapshot(items)
+
+        with open(self.path_to_delta(), "ab") as handle:
+            self.store.codec.dump(handle, changes)
+
+        self.journal.deltas = deltas
+
+    def read_delta(
+        self, offset: int = 0
+    ) -> Iterator[dict[int, Optional[dict[str, Any]]]]:
+        """Reads the blocks of changes appended to the delta after its first offset bytes"""
+        if os.path.exists(delta := self.path_to_delta()):
+            with open(delta, "rb") as handle:
+                handle.seek(offset)
+                yield from self.store.codec.load(handle)
+
+    def get_columns(self) -> "Flexmeta.Columns":
+        columns = Flexmeta.flextable_columns.get(self.uniqid)
+
+        if columns is None or columns.stamp != self.stamp_select()[:2]:
+            # the writers replace the columns under the lock
+            with self.lock():
+                columns = Flexmeta.Columns(self.path_to_columns())
+
+            Flexmeta.flextable_columns[self.uniqid] = columns
+
+        return columns
+
+    def load_columns(self) -> "Flexmeta.Columns":
+        self.journal.load()
+
+        if self.has_commits() or not os.path.exists(self.path_to_select()):
+            self.merge_columns()
+
+        # the columns may have been merged by another process, here or in merge_columns()
+        if not self.has_column_indexes():
+            with self.lock().shared():
+                self.load_indexes()
+                Flexmeta.flextable_stamps[self.uniqid] = self.stamp_select()
+
+        return self.get_columns()
+
+    def read_commits(self) -> dict[int, Optional[dict[str, Any]]]:
+        """Reads the rows of the journal commits, None for the deleted ones"""
+        commits = {selected_id: what for what, selected_id in self.journal.commits}
+        changes: dict[int, Optional[dict[str, Any]]] = {}
+        # the rows updated by other processes are read at their new offsets
+        self.store.refresh()
+
+        for selected_id, what in commits.items():
+            if what == "DELETED":
+                changes[selected_id] = None
+                continue
+
+            if not isinstance(item := self.store.read(selected_id), dict):
+                self.store.reset()
+
+                if not isinstance(item := self.store.read(selected_id), dict):
+                    raise Exception(
+                        f"Flexmeta cannot read row {selected_id} of the journal, nothing was merged: {self.name_d}"
+                    )
+
+            changes[selected_id] = item
+
+        return changes
+
+    def has_column_indexes(self) -> bool:
+        """Tells if the indexes in memory were built on the current columns, which another process may have rewritten"""
+        if not self.has_indexes():
+            return False
+
+        return Flexmeta.flextable_stamps.get(self.uniqid) == self.stamp_select()
+
+    def merge_columns(self):
+        """Applies the journal commits to the columnar snapshot one column at a time, without loading the rows"""
+        if not os.path.isdir(self.name_d):
+            return
+
+        with self.lock():
+            self.journal.load()
+            started, bytes_read = time.perf_counter(), self.store.bytes_read
+            changes: Optional[dict[int, Optional[dict[str, Any]]]] = None
+            indexed = self.has_column_indexes()
+            defaults = self.defaults()
+
+            if not os.path.exists(self.path_to_select()):
+                items = {item["id"]: item for item in self.store.scan()}
+                Flexmeta.Columns.write(self.path_to_columns(), items, defaults)
+                event, measures = "rebuild", {"rows": len(items)}
+            elif self.has_commits():
+                changes = self.read_commits()
+                self.get_columns().merge(changes, defaults)
+                event, measures = "replay", {"commits": len(self.journal.commits)}
+            else:
+                return
+
+            if Flexmeta.hooks:
+                Flexmeta.emit(
+                    event,
+                    table=self.name_d,
+                    bytes=self.store.bytes_read - bytes_read,
+                    seconds=time.perf_counter() - started,
+                    **measures,
+                )
+
+            self.journal.count = self.get_columns().count
+            self.journal.merged += len(self.journal.commits)
+            self.journal.commits = []
+            self.journal.save()
+            Flexmeta.flextable_versions[self.uniqid] = self.version() + 1
+
+            if indexed and changes is not None:
+                for index in sum(self.get_indexes().values(), []):
+                    for selected_id, item in changes.items():
+                        if item is None:
+                            index.remove(selected_id)
+                        else:
+                            index.update(selected_id, item, defaults)
+
+                Flexmeta.flextable_stamps[self.uniqid] = self.stamp_select()
+                self.save_indexes()
+            else:
+                Flexmeta.flextable_stamps[self.uniqid] = self.stamp_select()
+                self.load_indexes(rebuild=True)
+
+    def compact(self) -> bool:
+        if self.partition:
+            return any([partition.compact() for partition in self.partitions()])
+
+        with self.lock():
+            return self.store.compact()
+
+    def flush(self) -> bool:
+        """Writes the offsets of the segments to their hint file, so a new process does not read them all"""
+        if self.partition:
+            return any([partition.flush() for partition in self.partitions()])
+
+        if not isinstance(store := self.store, Flexmeta.SegmentStore):
+            return False
+
+        with self.lock():
+            store.refresh()
+            store.flush()
+
+        return True
+
+    def migrate(self) -> int:
+        if self.partition:
+            return sum(partition.migrate() for partition in self.partitions())
+
+        if not isinstance(store := self.store, Flexmeta.SegmentStore):
+            return 0
+
+        with self.lock():
+            return store.migrate()
+
+    def version(self) -> int:
+        return Flexmeta.flextable_versions.get(self.uniqid, 0)
+
+    def get_arrays(self, stamp: Any) -> Optional[dict[Any, Any]]:
+        """Returns the arrays cached for the rows loaded at this stamp, not for the current file"""
+        if numpy is None:
+            return None
+
+        stamp = (self.version(), stamp)
+
+        if (arrays := Flexmeta.flextable_arrays.get(self.uniqid)) is None:
+            arrays = Flexmeta.flextable_arrays[self.uniqid] = (stamp, {})
+        elif arrays[0] != stamp:
+            arrays = Flexmeta.flextable_arrays[self.uniqid] = (stamp, {})
+
+        return arrays[1]
+
+    @staticmethod
+    def vector(values: list[Any]) -> Any:
+        types = {type(value) for value in values}
+
+        try:
+            if types == {int}:
+                return numpy.array(values, dtype=numpy.int64)
+            elif types == {float}:
+                return numpy.array(values, dtype=numpy.float64)
+            elif types == {bool}:
+                return numpy.array(values, dtype=numpy.bool_)
+            elif types == {str} and all("\x00" not in value for value in values):
+                return numpy.array(values, dtype=numpy.str_)
+        except OverflowError:
+            pass
+
+        array = numpy.empty(len(values), dtype=object)
+        array[:] = values
+
+        return array
+
+    def get_indexes(self) -> dict[str, list["Flexmeta.Index"]]:
+        return Flexmeta.flextable_indexes.get(self.uniqid, {})
+
+    def has_indexes(self) -> bool:
+        if self.uniqid not in Flexmeta.flextable_indexes:
+            return not self.indexes
+
+        indexes = self.get_indexes()
+
+        for path, kinds in self.indexes.items():
+            if {index.kind for index in indexes.get(path, [])} < set(kinds):
+                return False
+
+        return True
+
+    def stamp_select(self) -> tuple[int, int, int]:
+        if os.path.exists(select := self.path_to_select()):
+            delta = self.path_to_delta()
+            deltas = os.stat(delta).st_size if os.path.exists(delta) else 0
+
+            return os.stat(select).st_mtime_ns, os.stat(select).st_size, deltas
+
+        return 0, 0, 0
+
+    def load_indexes(
+        self, items: Optional[dict[int, dict[str, Any]]] = None, rebuild: bool = False
+    ):
+        kinds = {
+            "hash": Flexmeta.HashIndex,
+            "sorted": Flexmeta.SortedIndex,
+            "text": Flexmeta.TextIndex,
+        }
+        stored: dict[str, list[Flexmeta.Index]] = {}
+        indexes: dict[str, list[Flexmeta.Index]] = {}
+
+        if not self.indexes:
+            return
+
+        defaults = self.defaults()
+
+        if not rebuild and os.path.exists(filename := self.path_to_indexes()):
+            with open(filename, "rb") as handle:
+                n_stored = pickle.load(handle)
+
+            if isinstance(n_stored, dict) and isinstance(
+                stamp := n_stored.get("select"), tuple
+            ):
+                n_stamp = self.stamp_select()
+
+                # the indexes are stored with the snapshot, the changes appended to its delta since are replayed
+                if stamp[:2] == n_stamp[:2] and stamp[2] <= n_stamp[2]:
+                    stored = n_stored["indexes"]
+
+                    for changes in self.read_delta(stamp[2]):
+                        for index in sum(stored.values(), []):
+                            for selected_id, item in changes.items():
+                                if item is None:
+                                    index.remove(selected_id)
+                                else:
+                                    index.update(selected_id, item, defaults)
+
+        for path, n_kinds in self.indexes.items():
+            for kind in n_kinds:
+                if kind not in kinds:
+                    raise Exception(f"Flexmeta index kind '{kind}' is not supported")
+
+                for index in stored.get(path, []):
+                    if index.kind == kind:
+                        break
+                else:
+                    index = kinds[kind](path)
+
+                    if items is not None:
+                        index.build(items.items(), defaults)
+                    elif self.snapshot == "columnar":
+                        index.build(self.get_columns().items(), defaults)
+                    else:
+                        index.build(self.load_all().items(), defaults)
+
+                indexes.setdefault(path, []).append(index)
+
+        Flexmeta.flextable_indexes[self.uniqid] = indexes
+
+        if stored != indexes:
+            self.save_indexes()
+
+    def save_indexes(self) -> bool:
+        if self.indexes and os.path.isdir(self.name_d):
+            indexes = {"select": self.stamp_select(), "indexes": self.get_indexes()}
+            Flexmeta.dump(self.path_to_indexes(), indexes)
+
+            return True
+        return False
+
+    class Lock:
+        """Advisory file lock around the writes of a table, shared by the threads and processes using it"""
+
+        def __init__(self, filename: str):
+            self.filename: str = filename
+            self.mutex: threading.RLock = threading.RLock()
+            self.handle: Any = None
+            self.pid: int = 0
+            self.depth: int = 0
+            self.exclusive: bool = False
+
+        def __str__(self) -> str:
+            return f'Flexmeta.Lock(filename="{self.filename}", depth={self.depth}, exclusive={self.exclusive})'
+
+        def __enter__(self) -> "Flexmeta.Lock":
+            self.acquire(exclusive=True)
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            self.release()
+
+        def shared(self) -> "Flexmeta.SharedLock":
+            return Flexmeta.SharedLock(self)
+
+        def acquire(self, exclusive: bool):
+            self.mutex.acquire()
+
+            try:
+                if self.depth > 0 and exclusive and not self.exclusive:
+                    # a write inside a shared lock converts it until the outermost release
+                    if self.handle is not None:
+                        fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX)
+
+                    self.exclusive = True
+                elif self.depth == 0 and fcntl is not None:
+                    # a forked process must not share the lock of its parent
+                    if self.handle is not None and (
+                        self.pid != os.getpid()
+                        or os.fstat(self.handle.fileno()).st_nlink == 0
+                    ):
+                        self.handle.close()
+                        self.handle = None
+
+                    if self.handle is None:
+                        if os.path.isdir(os.path.dirname(self.filename)):
+                            self.handle = open(self.filename, "ab")
+                            self.pid = os.getpid()
+
+                    if self.handle is not None:
+                        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+                        fcntl.flock(self.handle.fileno(), operation)
+
+                if self.depth == 0:
+                    self.exclusive = exclusive
+            except BaseException:
+                self.mutex.release()
+                raise
+
+            self.depth += 1
+
+        def release(self):
+            self.depth -= 1
+
+            if self.depth == 0 and self.handle is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+
+            self.mutex.release()
+
+    class SharedLock:
+        """Shared mode of a table lock, taken to read the files that only the exclusive lock writes"""
+
+        def __init__(self, lock: "Flexmeta.Lock"):
+            self.lock: Flexmeta.Lock = lock
+
+        def __str__(self) -> str:
+            return f"Flexmeta.SharedLock(lock={self.lock})"
+
+        def __enter__(self) -> "Flexmeta.Lock":
+            self.lock.acquire(exclusive=False)
+            return self.lock
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            self.lock.release()
+
+    class Profile:
+        """Collects the instrumentation events emitted while it is entered"""
+
+        def __init__(self):
+            self.events: list[tuple[str, dict[str, Any]]] = []
+
+        def __str__(self) -> str:
+            return f"Flexmeta.Profile(events={len(self.events)})"
+
+        def __call__(self, event: str, data: dict[str, Any]):
+            self.events.append((event, data))
+
+        def __enter__(self) -> "Flexmeta.Profile":
+            Flexmeta.hooks.append(self)
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            Flexmeta.hooks.remove(self)
+
+        def totals(self) -> dict[str, dict[str, float]]:
+            """Sums the numeric measures per event name, with the number of events"""
+            totals: dict[str, dict[str, float]] = {}
+
+            for event, data in self.events:
+                total = totals.setdefault(event, {"events": 0})
+                total["events"] += 1
+
+                for key, value in data.items():
+                    if isinstance(value, (int, float)):
+                        total[key] = total.get(key, 0) + value
+
+            return totals
+
+    class Batch:
+        def __init__(self, flexmeta: "Flexmeta"):
+            self.flexmeta: Flexmeta = flexmeta
+            self.flextables: dict[int, "Flextable"] = {}
+            self.n_flextables: dict[int, "Flextable"] = {}
+
+        def __str__(self) -> str:
+            return f"Flexmeta.Batch(name={self.flexmeta.name}, count={len(self.flextables)})"
+
+        def __enter__(self) -> "Flexmeta.Batch":
+            self.flexmeta.journal.load()
+            Flexmeta.flextable_batches[self.flexmeta.uniqid] = self
+            return self
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            Flexmeta.flextable_batches.pop(self.flexmeta.uniqid, None)
+
+            if exc_type is None and not self.commit():
+                raise Exception(
+                    f"Flexmeta batch rejected, max_size ({self.flexmeta.max_size}) exceeded: {self.flexmeta.name}"
+                )
+
+            self.flextables, self.n_flextables = {}, {}
+
+        def add(self, flextable: "Flextable") -> bool:
+            """Queues a row, the whole batch being checked against max_size when it ends"""
+            journal = self.flexmeta.journal
+
+            if id(flextable) in self.flextables:
+                return True
+
+            if Flexmeta.is_new(flextable) or flextable.id >= journal.next_id:
+                self.n_flextables[id(flextable)] = flextable
+
+            self.flextables[id(flextable)] = flextable
+
+            return True
+
+        def commit(self) -> bool:
+            flextables = list(self.flextables.values())
+
+            if not flextables:
+                return True
+
+            if self.flexmeta.save_objects(flextables, list(self.n_flextables.values())):
+                self.flextables, self.n_flextables = {}, {}
+                return True
+
+            return False
+
+    class ObjectCache:
+        """Keeps the encoded rows of the last point lookups of a table, up to `Flexmeta.object_cache_size`"""
+
+        def __init__(self):
+            self.items: OrderedDict[int, bytes] = OrderedDict()
+            self.stamp: Optional[tuple[int, int, int]] = None
+            self.position: int = 0
+            self.hits: int = 0
+            self.misses: int = 0
+            self.evictions: int = 0
+            self.invalidations: int = 0
+
+        def __str__(self) -> str:
+            return f"Flexmeta.ObjectCache(size={len(self.items)}, hits={self.hits}, misses={self.misses})"
+
+        def get(self, selected_id: int) -> Optional[bytes]:
+            if (data := self.items.get(selected_id)) is None:
+                self.misses += 1
+                return None
+
+            self.items.move_to_end(selected_id)
+            self.hits += 1
+            self.trim()
+
+            return data
+
+        def put(self, selected_id: int, data: bytes):
+            self.items[selected_id] = data
+            self.items.move_to_end(selected_id)
+            self.trim()
+
+        def trim(self):
+            while len(self.items) > max(Flexmeta.object_cache_size, 0):
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+        def discard(self, ids: Iterable[int]):
+            for selected_id in ids:
+                if self.items.pop(selected_id, None) is not None:
+                    self.invalidations += 1
+
+        def clear(self):
+            self.invalidations += len(self.items)
+            self.items.clear()
+
+        def sync(
+            self,
+            stamp: Optional[tuple[int, int, int]],
+            merged: int,
+            commits: list[tuple[str, int]],
+        ):
+            """Discards the rows of the journal commits not seen yet, or every row if they were merged"""
+            if merged > self.position:
+                self.clear()
+            else:
+                self.discard(
+                    selected_id for _, selected_id in commits[self.position - merged :]
+                )
+
+            self.stamp = stamp
+            self.position = merged + len(commits)
+
+        def stats(self) -> dict[str, int]:
+            return {
+                "size": len(self.items),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    class Codec:
+        """Encodes the rows of a table, one by one or by blocks of {id: row or None} for the snapshots"""
+
+        name: str = ""
+        errors: tuple[type[Exception], ...] = (TypeError, ValueError)
+
+        def __init__(self, dirname: str, name: str):
+            self.dirname: str = dirname
+            self.name_t: str = name
+
+        def __str__(self) -> str:
+            return f'Flexmeta.{self.__class__.__name__}(dirname="{self.dirname}")'
+
+        def encode(self, item: dict[str, Any]) -> bytes:
+            try:
+                return self.to_bytes(item)
+            except self.errors as e:
+                raise Exception(
+                    f"Flexmeta codec '{self.name}' cannot encode row {item.get('id')}: {e}"
+                )
+
+        def decode(self, data: bytes) -> dict[str, Any]:
+            return self.from_bytes(data)
+
+        def to_bytes(self, item: dict[str, Any]) -> bytes:
+            raise NotImplementedError
+
+        def from_bytes(self, data: bytes) -> dict[str, Any]:
+            raise NotImplementedError
+
+        def dump(self, handle: Any, items: dict[int, Optional[dict[str, Any]]]):
+            header = Flexmeta.SegmentStore.header
+
+            for selected_id, item in items.items():
+                payload = b"" if item is None else self.encode(item)
+                handle.write(header.pack(selected_id, item is not None, len(payload)))
+                handle.write(payload)
+
+        def load(self, handle: Any) -> Iterator[dict[int, Optional[dict[str, Any]]]]:
+            header = Flexmeta.SegmentStore.header
+            items: dict[int, Optional[dict[str, Any]]] = {}
+
+            while len(data := handle.read(header.size)) == header.size:
+                selected_id, flag, length = header.unpack(data)
+
+                if len(payload := handle.read(length)) < length:
+                    break
+
+                items[selected_id] = self.decode(payload) if flag else None
+
+            yield items
+
+    class PickleCodec(Codec):
+        name: str = "pickle"
+
+        def to_bytes(self, item: dict[str, Any]) -> bytes:
+            return pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+
+        def from_bytes(self, data: bytes) -> dict[str, Any]:
+            return pickle.loads(data)
+
+        def dump(self, handle: Any, items: dict[int, Optional[dict[str, Any]]]):
+            pickle.dump(items, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+        def load(self, handle: Any) -> Iterator[dict[int, Optional[dict[str, Any]]]]:
+            while True:
+                try:
+                    yield pickle.load(handle)
+                except (EOFError, pickle.UnpicklingError):
+                    return
+
+    class JsonCodec(Codec):
+        """Rows of plain values only: tuples are read back as lists, and dict keys as strings"""
+
+        name: str = "json"
+
+        def to_bytes(self, item: dict[str, Any]) -> bytes:
+            return json.dumps(item, separators=(",", ":")).encode()
+
+        def from_bytes(self, data: bytes) -> dict[str, Any]:
+            return json.loads(data)
+
+    class MarshalCodec(Codec):
+        """Rows of plain values (str, int, float, bool, None, bytes, and containers of them), and of plain objects"""
+
+        name: str = "marshal"
+        klass: str = "__class__"
+
+        def to_bytes(self, item: dict[str, Any]) -> bytes:
+            try:
+                return marshal.dumps(item)
+            except ValueError:
+                # a row holding objects is wrapped in a tuple, the other rows are decoded as they are
+                return marshal.dumps((self.to_plain(item),))
+
+        def from_bytes(self, data: bytes) -> dict[str, Any]:
+            if type(item := marshal.loads(data)) is dict:
+                return item
+
+            return self.from_plain(item[0])
+
+        @staticmethod
+        def to_plain(value: Any) -> Any:
+            """Flattens the plain objects of the dicts into dicts of their attributes and their class path"""
+            if type(value) is dict and Flexmeta.MarshalCodec.klass in value:
+                # a dict holding the class key is escaped as its pairs, so that it is not read back as an object
+                return {
+                    Flexmeta.MarshalCodec.klass: None,
+                    "items": [
+                        (k, Flexmeta.MarshalCodec.to_plain(v)) for k, v in value.items()
+                    ],
+                }
+            elif type(value) is dict:
+                return {k: Flexmeta.MarshalCodec.to_plain(v) for k, v in value.items()}
+
+            if Flexmeta.is_object(value):
+                klass = type(value)
+
+                if "<locals>" in klass.__qualname__:
+                    raise TypeError(f"cannot import class {klass.__qualname__}")
+
+                return {
+                    Flexmeta.MarshalCodec.klass: f"{klass.__module__}:{klass.__qualname__}",
+                    **Flexmeta.MarshalCodec.to_plain(value.__dict__),
+                }
+
+            return value
+
+        @staticmethod
+        def from_plain(value: Any) -> Any:
+            if type(value) is not dict:
+                return value
+            elif (
+                Flexmeta.MarshalCodec.klass in value
+                and value[Flexmeta.MarshalCodec.klass] is None
+            ):
+                return {
+                    k: Flexmeta.MarshalCodec.from_plain(v) for k, v in value["items"]
+                }
+
+            items = {
+                k: Flexmeta.MarshalCodec.from_plain(v)
+                for k, v in value.items()
+                if k != Flexmeta.MarshalCodec.klass
+            }
+
+            if Flexmeta.MarshalCodec.klass not in value:
+                return items
+
+            module, _, qualname = value[Flexmeta.MarshalCodec.klass].partition(":")
+            klass: Any = importlib.import_module(module)
+
+            for name in qualname.split("."):
+                klass = getattr(klass, name)
+
+            n_item = klass.__new__(klass)
+            n_item.__dict__.update(items)
+
+            return n_item
+
+    class BinaryCodec(MarshalCodec):
+        """Stores the attribute names once per schema, and only the values in each row"""
+
+        name: str = "binary"
+        number: struct.Struct = struct.Struct("<I")
+        objects: int = 1 << 31
+
+        def __init__(self, dirname: str, name: str):
+            super().__init__(dirname, name)
+            self.schemas: list[tuple[str, ...]] = []
+            self.numbers: dict[tuple[str, ...], int] = {}
+
+        def path_to_schemas(self) -> str:
+            return os.path.join(self.dirname, f"{self.name_t}.schemas")
+
+        def load_schemas(self):
+            if os.path.exists(filename := self.path_to_schemas()):
+                with open(filename, "rb") as handle:
+                    self.schemas = [tuple(schema) for schema in json.load(handle)]
+
+                self.numbers = {schema: n for n, schema in enumerate(self.schemas)}
+
+        def get_number(self, schema: tuple[str, ...]) -> int:
+            if schema not in self.numbers:
+                self.load_schemas()
+
+                if schema not in self.numbers:
+                    self.numbers[schema] = len(self.schemas)
+                    self.schemas.append(schema)
+                    data = json.dumps(self.schemas).encode()
+                    os.makedirs(self.dirname, exist_ok=True)
+                    Flexmeta.replace(self.path_to_schemas(), lambda h: h.write(data))
+
+            return self.numbers[schema]
+
+        def to_bytes(self, item: dict[str, Any]) -> bytes:
+            number = self.get_number(tuple(item))
+
+            try:
+                data = marshal.dumps(tuple(item.values()))
+            except ValueError:
+                # the high bit of the schema number flags a row holding objects
+                number |= self.objects
+                data = marshal.dumps(tuple(map(self.to_plain, item.values())))
+
+            return self.number.pack(number) + data
+
+        def from_bytes(self, data: bytes) -> dict[str, Any]:
+            (number,) = self.number.unpack_from(data)
+            objects, number = number & self.objects, number & ~self.objects
+
+            if number >= len(self.schemas):
+                self.load_schemas()
+
+            item = dict(
+                zip(self.schemas[number], marshal.loads(data[self.number.size :]))
+            )
+
+            if objects:
+                return {k: self.from_plain(v) for k, v in item.items()}
+
+            return item
+
+    class ObjectStore:
+        def __init__(
+            self, dirname: str, name: str, codec: Optional["Flexmeta.Codec"] = None
+        ):
+            self.dirname: str = dirname
+            self.name: str = name
+            self.codec: Flexmeta.Codec = codec or Flexmeta.PickleCodec(dirname, name)
+            self.bytes_read: int = 0
+
+        def __str__(self) -> str:
+            return f'Flexmeta.ObjectStore(dirname="{self.dirname}")'
+
+        def path_to_object(self, selected_id: int) -> str:
+            return os.path.join(self.dirname, f"{selected_id}.object")
+
+        def exists(self, selected_id: int) -> bool:
+            return os.path.exists(self.path_to_object(selected_id))
+
+        def read(self, selected_id: int) -> Optional[dict[str, Any]]:
+            if (data := self.read_data(selected_id)) is not None:
+                return self.codec.decode(data)
+
+        def read_data(self, selected_id: int) -> Optional[bytes]:
+            try:
+                with open(self.path_to_object(selected_id), "rb") as handle:
+                    data = handle.read()
+            except FileNotFoundError:
+                return None
+
+            self.bytes_read += len(data)
+
+            return data
+
+        def write(self, selected_id: int, item: dict[str, Any]):
+            data = self.codec.encode(item)
+            Flexmeta.replace(self.path_to_object(selected_id), lambda h: h.write(data))
+
+        def write_many(self, items: list[tuple[int, dict[str, Any]]]):
+            filenames: list[str] = []
+
+            try:
+                for selected_id, item in items:
+                    filenames.append(f"{self.path_to_object(selected_id)}.tmp")
+
+                    with open(filenames[-1], "wb") as handle:
+                        handle.write(self.codec.encode(item))
+            except BaseException:
+                for filename in filenames:
+                    if os.path.exists(filename):
+                        os.unlink(filename)
+                raise
+
+            for filename in filenames:
+                os.replace(filename, filename[:-4])
+
+        def delete(self, selected_id: int) -> bool:
+            if os.path.exists(filename := self.path_to_object(selected_id)):
+                os.unlink(filename)
+                return True
+
+            return False
+
+        def ids(self) -> list[int]:
+            filenames = glob.glob(os.path.join(self.dirname, "*.object"))
+
+            return [int(os.path.basename(filename)[:-7]) for filename in filenames]
+
+        def scan(self) -> Iterator[dict[str, Any]]:
+            for selected_id in sorted(self.ids()):
+                if os.path.exists(filename := self.path_to_object(selected_id)):
+                    with open(filename, "rb") as handle:
+                        data = handle.read()
+
+                    self.bytes_read += len(data)
+
+                    if isinstance(item := self.codec.decode(data), dict):
+                        yield item
+
+        def reset(self):
+            pass
+
+        def refresh(self):
+            pass
+
+        def flush(self):
+            pass
+
+        def compact(self) -> bool:
+            return False
+
+    class SegmentStore:
+        """Append-only segment files of (id, flag, length, payload) records"""
+
+        header: struct.Struct = struct.Struct("<qBI")
+        max_size: int = 64 * 1024 * 1024
+        compact_ratio: float = 0.5
+        compact_min: int = 1000
+
+        def __init__(
+            self, dirname: str, name: str, codec: Optional["Flexmeta.Codec"] = None
+        ):
+            self.dirname: str = dirname
+            self.name: str = name
+            self.codec: Flexmeta.Codec = codec or Flexmeta.PickleCodec(dirname, name)
+            self.objects: Flexmeta.ObjectStore = Flexmeta.ObjectStore(
+                dirname, name, self.codec
+            )
+            self.offsets: dict[int, tuple[int, int, int]] = {}
+            self.positions: dict[int, int] = {}
+            self.records: int = 0
+            self.loaded: bool = False
+            self.legacy: Optional[bool] = None
+            self.handles: dict[int, Any] = {}
+            self.bytes_read: int = 0
+
+        def __str__(self) -> str:
+            return f'Flexmeta.SegmentStore(dirname="{self.dirname}", segments={len(self.positions)}, live={len(self.offsets)}, records={self.records})'
+
+        def path_to_segment(self, segment: int) -> str:
+            return os.path.join(self.dirname, f"{self.name}.{segment:06d}.segment")
+
+        def path_to_hint(self) -> str:
+            return os.path.join(self.dirname, f"{self.name}.segments")
+
+        def segments(self) -> list[int]:
+            pattern = os.path.join(self.dirname, f"{glob.escape(self.name)}.*.segment")
+            return sorted(int(f.split(".")[-2]) for f in glob.glob(pattern))
+
+        def close(self):
+            for handle in self.handles.values():
+                handle.close()
+
+            self.handles = {}
+
+        def reset(self):
+            self.close()
+            self.offsets, self.positions, self.records = {}, {}, 0
+            self.loaded = True
+
+            if os.path.exists(hint := self.path_to_hint()):
+                with open(hint, "rb") as handle:
+                    items = pickle.load(handle)
+
+                for segment, position in items["positions"].items():
+                    if not os.path.exists(filename := self.path_to_segment(segment)):
+                        break
+                    if os.path.getsize(filename) < position:
+                        break
+                else:
+                    self.offsets = items["offsets"]
+                    self.positions = items["positions"]
+                    self.records = items["records"]
+
+            for segment in self.segments():
+                self.positions.setdefault(segment, 0)
+
+        def refresh(self):
+            if not self.loaded:
+                self.reset()
+            elif not self.positions or not os.path.exists(
+                self.path_to_segment(min(self.positions))
+            ):
+                # the segments were created or compacted by another process
+                if set(self.positions) != set(self.segments()):
+                    self.reset()
+
+            segment = max(self.positions, default=0)
+
+            while os.path.exists(self.path_to_segment(segment + 1)):
+                segment += 1
+                self.positions[segment] = 0
+
+            try:
+                for segment, position in sorted(self.positions.items()):
+                    if os.path.getsize(self.path_to_segment(segment)) > position:
+                        self.positions[segment] = self.replay(segment, position)
+            except FileNotFoundError:
+                # a compaction removed the segments meanwhile
+                self.reset()
+                self.refresh()
+
+        def replay(self, segment: int, position: int) -> int:
+            with open(self.path_to_segment(segment), "rb") as handle:
+                handle.seek(position)
+
+                while len(header := handle.read(self.header.size)) == self.header.size:
+                    selected_id, flag, length = self.header.unpack(header)
+                    offset = position + self.header.size
+
+                    if len(handle.read(length)) < length:
+                        break
+
+                    if self.offsets.get(selected_id, (0, 0, 0))[:2] != (
+                        segment,
+                        offset,
+                    ):
+                        self.records += 1
+
+                        if flag:
+                            self.offsets[selected_id] = (segment, offset, length)
+                        else:
+                            self.offsets.pop(selected_id, None)
+
+                    position = offset + length
+
+            return position
+
+        def append(self, records: list[tuple[int, Optional[bytes]]]):
+            segment = max(self.positions, default=1)
+            filename = self.path_to_segment(segment)
+            data = b"".join(
+                self.header.pack(selected_id, payload is not None, len(payload or b""))
+                + (payload or b"")
+                for selected_id, payload in records
+            )
+
+            if os.path.exists(filename) and os.path.getsize(filename) >= self.max_size:
+                segment += 1
+
+            with open(self.path_to_segment(segment), "ab") as handle:
+                start = handle.tell()
+
+                try:
+                    handle.write(data)
+                    handle.flush()
+                except BaseException:
+                    handle.truncate(start)
+                    raise
+
+                position = handle.tell()
+                start = position - len(data)
+
+            if self.positions.get(segment, 0) == start:
+                self.positions[segment] = position
+            else:
+                self.positions.setdefault(segment, 0)
+
+            for selected_id, payload in records:
+                start += self.header.size
+
+                if payload is not None:
+                    self.offsets[selected_id] = (segment, start, len(payload))
+                    start += len(payload)
+                else:
+                    self.offsets.pop(selected_id, None)
+
+            self.records += len(records)
+
+        def chunks(
+            self, records: Iterator[tuple[int, Optional[bytes]]]
+        ) -> Iterator[list[tuple[int, Optional[bytes]]]]:
+            chunk: list[tuple[int, Optional[bytes]]] = []
+            size = 0
+
+            for selected_id, payload in records:
+                chunk.append((selected_id, payload))
+                size += self.header.size + len(payload or b"")
+
+                if size >= self.max_size:
+                    yield chunk
+                    chunk, size = [], 0
+
+            if chunk:
+                yield chunk
+
+        def is_legacy(self) -> bool:
+            if self.legacy is None and os.path.isdir(self.dirname):
+                with os.scandir(self.dirname) as entries:
+                    self.legacy = any(e.name.endswith(".object") for e in entries)
+
+            return bool(self.legacy)
+
+        def exists(self, selected_id: int) -> bool:
+            self.refresh()
+
+            if selected_id in self.offsets:
+                return True
+
+            return self.is_legacy() and self.objects.exists(selected_id)
+
+        def read_bytes(self, segment: int, offset: int, length: int) -> bytes:
+            if segment not in self.handles:
+                self.handles[segment] = open(self.path_to_segment(segment), "rb")
+
+            self.handles[segment].seek(offset)
+            self.bytes_read += length
+
+            return self.handles[segment].read(length)
+
+        def read(self, selected_id: int) -> Optional[dict[str, Any]]:
+            if (data := self.read_data(selected_id)) is not None:
+                return self.codec.decode(data)
+
+        def read_data(self, selected_id: int) -> Optional[bytes]:
+            if selected_id not in self.offsets:
+                self.refresh()
+
+            if selected_id not in self.offsets:
+                return self.objects.read_data(selected_id) if self.is_legacy() else None
+
+            try:
+                return self.read_bytes(*self.offsets[selected_id])
+            except FileNotFoundError:
+                self.reset()
+                return self.read_data(selected_id)
+
+        def write(self, selected_id: int, item: dict[str, Any]):
+            self.write_many([(selected_id, item)])
+
+        def write_many(self, items: list[tuple[int, dict[str, Any]]]):
+            self.refresh()
+            self.append([(k, self.codec.encode(item)) for k, item in items])
+
+            if self.is_legacy():
+                for selected_id, _ in items:
+                    self.objects.delete(selected_id)
+
+            if self.records >= self.compact_min:
+                if len(self.offsets) < self.records * (1 - self.compact_ratio):
+                    self.compact()
+
+        def delete(self, selected_id: int) -> bool:
+            is_deleted = self.is_legacy() and self.objects.delete(selected_id)
+            self.refresh()
+
+            if selected_id in self.offsets:
+                self.append([(selected_id, None)])
+                return True
+
+            return is_deleted
+
+        def scan(self) -> Iterator[dict[str, Any]]:
+            if not os.path.isdir(self.dirname):
+                return
+
+            self.refresh()
+
+            selected_ids = set(self.offsets)
+
+            if self.is_legacy():
+                selected_ids.update(self.objects.ids())
+
+            for selected_id in sorted(selected_ids):
+                if isinstance(item := self.read(selected_id), dict):
+                    yield item
+
+        def flush(self):
+            if os.path.isdir(self.dirname) and self.positions:
+                items = {
+                    "offsets": self.offsets,
+                    "positions": self.positions,
+                    "records": self.records,
+                }
+                Flexmeta.dump(self.path_to_hint(), items)
+
+        def compact(self) -> bool:
+            self.refresh()
+
+            if not self.positions or self.records == len(self.offsets):
+                return False
+
+            segments = list(self.positions)
+            offsets = sorted(self.offsets.items(), key=lambda e: e[1])
+            self.offsets, self.positions = {}, {max(segments) + 1: 0}
+            self.records = 0
+
+            for records in self.chunks(
+                (selected_id, self.read_bytes(*offset))
+                for selected_id, offset in offsets
+            ):
+                self.append(records)
+
+            self.close()
+            self.flush()
+
+            for segment in segments:
+                os.unlink(self.path_to_segment(segment))
+
+            return True
+
+        def migrate(self) -> int:
+            count = 0
+
+            if not self.is_legacy():
+                return count
+
+            self.refresh()
+
+            for records in self.chunks(
+                (item["id"], self.codec.encode(item))
+                for item in self.objects.scan()
+                if item["id"] not in self.offsets
+            ):
+                self.append(records)
+                count += len(records)
+
+            self.flush()
+
+            for filename in glob.glob(os.path.join(self.dirname, "*.object")):
+                os.unlink(filename)
+
+            self.legacy = False
+
+            return count
+
+    class Column:
+        header: struct.Struct = struct.Struct("<4scxxxQ")
+
+        def __init__(self, filename: str):
+            with open(filename, "rb") as handle:
+                magic, kind, self.count = self.header.unpack(
+                    handle.read(self.header.size)
+                )
+                self.kind: str = kind.decode()
+                self.buffer: Any = b""
+
+                if os.fstat(handle.fileno()).st_size > self.header.size:
+                    self.buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+            data = memoryview(self.buffer)[self.header.size :]
+
+            if self.kind in "qd?":
+                self.values: Any = data.cast(self.kind)
+            else:
+                size = (self.count + 1) * 8
+                self.offsets: Any = data[:size].cast("q")
+                self.values = data[size:]
+
+        def __len__(self) -> int:
+            return self.count
+
+        def __getitem__(self, position: int) -> Any:
+            if self.kind in "qd?":
+                return self.values[position]
+
+            value = self.values[self.offsets[position] : self.offsets[position + 1]]
+
+            if self.kind == "s":
+                return str(value, "utf-8")
+
+            return pickle.loads(value)
+
+        @staticmethod
+        def write(filename: str, values: list[Any]):
+            types = {type(value) for value in values}
+            kind = "o"
+
+            if types == {int} and all(-(2**63) <= v < 2**63 for v in values):
+                kind = "q"
+            elif types == {float}:
+                kind = "d"
+            elif types == {bool}:
+                kind = "?"
+            elif types == {str}:
+                kind = "s"
+
+            with open(filename, "wb") as handle:
+                handle.write(
+                    Flexmeta.Column.header.pack(b"FLXC", kind.encode(), len(values))
+                )
+
+                if kind in "qd?":
+                    handle.write(struct.pack(f"<{len(values)}{kind}", *values))
+                    return
+
+                if kind == "s":
+                    blobs = [value.encode("utf-8") for value in values]
+                else:
+                    blobs = [
+                        pickle.dumps(value, pickle.HIGHEST_PROTOCOL) for value in values
+                    ]
+
+                offsets, offset = [0], 0
+
+                for blob in blobs:
+                    offset += len(blob)
+                    offsets.append(offset)
+
+                handle.write(struct.pack(f"<{len(offsets)}q", *offsets))
+                handle.write(b"".join(blobs))
+
+    class Columns:
+        """Columnar snapshot: one memory-mapped file per flattened attribute path"""
+
+        def __init__(self, dirname: str):
+            self.dirname: str = dirname
+            self.filename: str = os.path.join(dirname, "meta")
+            self.stamp: tuple[int, int] = (0, 0)
+            self.count: int = 0
+            self.files: dict[str, str] = {}
+            self.objects: dict[str, Any] = {}
+            self.columns: dict[str, Flexmeta.Column] = {}
+            self.ids: Optional[dict[int, int]] = None
+
+            if os.path.exists(self.filename):
+                with open(self.filename, "rb") as handle:
+                    meta = pickle.load(handle)
+                    self.stamp = (
+                        os.fstat(handle.fileno()).st_mtime_ns,
+                        os.fstat(handle.fileno()).st_size,
+                    )
+
+                self.count = meta["count"]
+                self.files = meta["files"]
+                self.objects = meta["objects"]
+
+            # mapped now, so the files of this generation can be unlinked by a later write
+            for path, filename in self.files.items():
+                self.columns[path] = Flexmeta.Column(os.path.join(dirname, filename))
+
+        def __str__(self) -> str:
+            return f'Flexmeta.Columns(dirname="{self.dirname}", count={self.count}, columns={list(self.files)})'
+
+        def has(self, path: str) -> bool:
+            return path in self.files or path in self.objects
+
+        def column(self, path: str) -> "Flexmeta.Column":
+            return self.columns[path]
+
+        def value(self, position: int, path: str) -> Any:
+            if path in self.files:
+                return self.column(path)[position]
+
+            item = self.objects[path]
+            items: dict[str, Any] = {}
+            prefix = f"{path}."
+
+            for n_path in self.files:
+                if n_path.startswith(prefix):
+                    items[n_path[len(prefix) :]] = self.column(n_path)[position]
+
+            for n_path in self.objects:
+                if n_path.startswith(prefix) and "." not in n_path[len(prefix) :]:
+                    items[n_path[len(prefix) :]] = self.value(position, n_path)
+
+            if item is dict:
+                return items
+
+            n_item = item.__new__(item)
+            n_item.__dict__.update(items)
+
+            return n_item
+
+        def row(self, position: int) -> dict[str, Any]:
+            item: dict[str, Any] = {}
+
+            for path in self.files:
+                if "." not in path:
+                    item[path] = self.column(path)[position]
+
+            for path in self.objects:
+                if "." not in path:
+                    item[path] = self.value(position, path)
+
+            return item
+
+        def rows(self) -> dict[int, dict[str, Any]]:
+            return dict(self.items())
+
+        def items(self) -> Iterator[tuple[int, dict[str, Any]]]:
+            for position in range(self.count):
+                yield (item := self.row(position))["id"], item
+
+        def positions(self) -> dict[int, int]:
+            if self.ids is None:
+                ids = self.column("id") if self.count else []
+                self.ids = {ids[position]: position for position in range(self.count)}
+
+            return self.ids
+
+        @staticmethod
+        def flatten(
+            path: str,
+            values: list[Any],
+            leaves: dict[str, list[Any]],
+            objects: dict[str, Any],
+            defaults: Any = None,
+        ):
+            klasses = {type(value) for value in values}
+
+            if len(klasses) == 1 and (
+                klasses == {dict} or Flexmeta.is_object(values[0])
+            ):
+                items = [v if isinstance(v, dict) else v.__dict__ for v in values]
+                names = list(dict.fromkeys(k for item in items for k in item))
+                defaults = Flexmeta.Columns.attributes(defaults)
+
+                if path:
+                    objects[path] = klasses.pop()
+
+                for name in names:
+                    n_path = f"{path}.{name}" if path else name
+                    n_default = defaults.get(name)
+                    n_values = [item.get(name, n_default) for item in items]
+                    Flexmeta.Columns.flatten(
+                        n_path, n_values, leaves, objects, n_default
+                    )
+            else:
+                leaves[path] = values
+
+        @staticmethod
+        def attributes(value: Any) -> dict[str, Any]:
+            """Returns the attributes of a row or of a nested object, empty for a leaf"""
+            if isinstance(value, dict):
+                return value
+
+            return getattr(value, "__dict__", {})
+
+        def layout(self) -> dict[str, list[str]]:
+            """Returns the attribute names under each object path, "" being the row"""
+            names: dict[str, list[str]] = {"": []}
+
+            for path in list(self.objects) + list(self.files):
+                parent, _, name = path.rpartition(".")
+                names.setdefault(parent, []).append(name)
+
+            return names
+
+        def leaves(
+            self, item: dict[str, Any], layout: dict[str, list[str]], defaults: Any
+        ) -> Optional[dict[str, Any]]:
+            """Returns the leaf values of a row in the layout of these columns, None if it does not fit"""
+            leaves: dict[str, Any] = {}
+
+            def walk(path: str, value: Any, defaults: Any) -> bool:
+                if path in self.files:
+                    leaves[path] = value
+                    return True
+
+                if type(value) is not (klass := self.objects.get(path, dict)):
+                    return False
+
+                items = value if klass is dict else value.__dict__
+                names, prefix = layout.get(path, []), f"{path}." if path else ""
+                defaults = Flexmeta.Columns.attributes(defaults)
+
+                if not set(items) <= set(names):
+                    return False
+
+                # the missing attributes are flattened as their defaults
+                return all(
+                    walk(
+                        prefix + name,
+                        items[name] if name in items else defaults.get(name),
+                        defaults.get(name),
+                    )
+                    for name in names
+                )
+
+            return leaves if walk("", item, defaults) else None
+
+        def merge(
+            self, changes: dict[int, Optional[dict[str, Any]]], defaults: dict[str, Any]
+        ):
+            """Writes the changed rows in a new generation, rewriting only the columns they change"""
+            positions, layout = self.positions(), self.layout()
+            leaves: dict[int, dict[str, Any]] = {}
+
+            for selected_id, item in changes.items():
+                if item is None:
+                    continue
+
+                if (n_leaves := self.leaves(item, layout, defaults)) is None:
+                    # the layout changes with the new rows: the columns are flattened again
+                    items = self.rows()
+
+                    for n_id, n_item in changes.items():
+                        if n_item is None:
+                            items.pop(n_id, None)
+                        else:
+                            items[n_id] = n_item
+
+                    return Flexmeta.Columns.write(self.dirname, items, defaults)
+
+                leaves[selected_id] = n_leaves
+
+            ids = self.column("id") if self.count else []
+            order: list[tuple[Optional[int], int]] = [
+                (position, ids[position])
+                for position in range(self.count)
+                if ids[position] not in changes or ids[position] in leaves
+            ]
+            order += [(None, i) for i in leaves if i not in positions]
+            updated = len(leaves) == len(changes) and positions.keys() >= leaves.keys()
+            columns: dict[str, list[Any] | str] = {}
+
+            for path, filename in self.files.items():
+                column = self.column(path)
+
+                # an update that keeps the values of a column keeps its file
+                if updated and all(
+                    type(value := column[positions[i]]) is type(leaves[i][path])
+                    and value == leaves[i][path]
+                    for i in leaves
+                ):
+                    columns[path] = filename
+                else:
+                    columns[path] = [
+                        column[position] if i not in leaves else leaves[i][path]
+                        for position, i in order
+                    ]
+
+            Flexmeta.Columns.commit(self.dirname, len(order), columns, self.objects)
+
+        @staticmethod
+        def write(
+            dirname: str, items: dict[int, dict[str, Any]], defaults: dict[str, Any]
+        ):
+            leaves: dict[str, list[Any]] = {}
+            objects: dict[str, Any] = {}
+
+            if items:
+                Flexmeta.Columns.flatten(
+                    "", list(items.values()), leaves, objects, defaults
+                )
+
+            Flexmeta.Columns.commit(dirname, len(items), dict(leaves), objects)
+
+        @staticmethod
+        def commit(
+            dirname: str,
+            count: int,
+            columns: dict[str, list[Any] | str],
+            objects: dict[str, Any],
+        ):
+            """Writes the columns given as values, keeps those given as a file name, then replaces the meta"""
+            files: dict[str, str] = {}
+            generation = uuid.uuid4().hex[:8]
+
+            os.makedirs(dirname, exist_ok=True)
+
+            for n, (path, values) in enumerate(columns.items()):
+                if isinstance(values, str):
+                    files[path] = values
+                else:
+                    files[path] = f"{generation}.{n}.column"
+                    Flexmeta.Column.write(os.path.join(dirname, files[path]), values)
+
+            with open(filename := os.path.join(dirname, "meta.tmp"), "wb") as handle:
+                meta = {"count": count, "files": files, "objects": objects}
+                pickle.dump(meta, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.replace(filename, os.path.join(dirname, "meta"))
+
+            for filename in glob.glob(os.path.join(dirname, "*.column")):
+                if os.path.basename(filename) not in files.values():
+                    os.unlink(filename)
+
+    class Index:
+        kind: str = ""
+
+        def __init__(self, path: str):
+            self.path: str = path
+            self.valid: bool = True
+            self.values: dict[int, Any] = {}
+
+        def __str__(self) -> str:
+            return f'Flexmeta.{self.__class__.__name__}(path="{self.path}", size={len(self.values)}, valid={self.valid})'
+
+        def build(
+            self,
+            items: Iterable[tuple[int, dict[str, Any]]],
+            defaults: dict[str, Any],
+        ):
+            for selected_id, item in items:
+                self.add(selected_id, item, defaults)
+
+        def add(self, selected_id: int, item: dict[str, Any], defaults: dict[str, Any]):
+            self.values[selected_id] = value = Flexmeta.extract(
+                item, self.path, defaults
+            )
+
+            if self.valid:
+                try:
+                    self.insert(selected_id, value)
+                except TypeError:
+                    self.valid = False
+
+        def remove(self, selected_id: int):
+            if selected_id in self.values:
+                value = self.values.pop(selected_id)
+
+                if self.valid:
+                    self.discard(selected_id, value)
+
+        def update(
+            self, selected_id: int, item: dict[str, Any], defaults: dict[str, Any]
+        ):
+            self.remove(selected_id)
+            self.add(selected_id, item, defaults)
+
+        def insert(self, selected_id: int, value: Any):
+            raise NotImplementedError
+
+        def discard(self, selected_id: int, value: Any):
+            raise NotImplementedError
+
+        def search(
+            self, operator: str, value: Any, sensitive: bool = True
+        ) -> Optional[set[int]]:
+            return None
+
+    class HashIndex(Index):
+        kind: str = "hash"
+
+        def __init__(self, path: str):
+            super().__init__(path)
+            self.buckets: dict[Any, set[int]] = {}
+
+        def insert(self, selected_id: int, value: Any):
+            self.buckets.setdefault(value, set()).add(selected_id)
+
+        def discard(self, selected_id: int, value: Any):
+            if (bucket := self.buckets.get(value)) is not None:
+                bucket.discard(selected_id)
+
+                if not bucket:
+                    del self.buckets[value]
+
+        def search(
+            self, operator: str, value: Any, sensitive: bool = True
+        ) -> Optional[set[int]]:
+            if not self.valid:
+                return None
+
+            try:
+                if operator == "==":
+                    return self.buckets.get(value, set())
+                elif operator == "!=":
+                    return self.values.keys() - self.buckets.get(value, set())
+                elif operator == "is_in":
+                    return set().union(*[self.buckets.get(v, ()) for v in value])
+            except TypeError:
+                pass
+
+            return None
+
+    class SortedIndex(Index):
+        kind: str = "sorted"
+
+        def __init__(self, path: str):
+            super().__init__(path)
+            self.entries: list[tuple[Any, int]] = []
+
+        def insert(self, selected_id: int, value: Any):
+            bisect.insort(self.entries, (value, selected_id))
+
+        def discard(self, selected_id: int, value: Any):
+            i = bisect.bisect_left(self.entries, (value, selected_id))
+
+            if i < len(self.entries) and self.entries[i] == (value, selected_id):
+                del self.entries[i]
+
+        def build(
+            self,
+            items: Iterable[tuple[int, dict[str, Any]]],
+            defaults: dict[str, Any],
+        ):
+            for selected_id, item in items:
+                self.values[selected_id] = Flexmeta.extract(item, self.path, defaults)
+
+            try:
+                self.entries = sorted((v, k) for k, v in self.values.items())
+            except TypeError:
+                self.valid = False
+
+        def sort(self, positions: dict[int, int], desc: bool = False) -> list[int]:
+            ids: list[int] = []
+            ties: list[int] = []
+            value: Any = None
+
+            for n_value, selected_id in (
+                reversed(self.entries) if desc else self.entries
+            ):
+                if ties and n_value != value:
+                    ids.extend(sorted(ties, key=positions.__getitem__))
+                    ties = []
+
+                if selected_id in positions:
+                    ties.append(selected_id)
+
+                value = n_value
+
+            ids.extend(sorted(ties, key=positions.__getitem__))
+
+            return ids
+
+        def search(
+            self, operator: str, value: Any, sensitive: bool = True
+        ) -> Optional[set[int]]:
+            def left(v: Any) -> int:
+                return bisect.bisect_left(self.entries, v, key=lambda e: e[0])
+
+            def right(v: Any) -> int:
+                return bisect.bisect_right(self.entries, v, key=lambda e: e[0])
+
+            if not self.valid:
+                return None
+
+            try:
+                if operator == "<":
+                    entries = self.entries[: left(value)]
+                elif operator == "<=":
+                    entries = self.entries[: right(value)]
+                elif operator == ">":
+                    entries = self.entries[right(value) :]
+                elif operator == ">=":
+                    entries = self.entries[left(value) :]
+                elif operator == "is_between":
+                    entries = self.entries[left(value[0]) : right(value[1])]
+                else:
+                    return None
+            except TypeError:
+                return None
+
+            return {selected_id for _, selected_id in entries}
+
+    class TextIndex(Index):
+        """Case-folded trigrams for contains, sorted terms and reversed terms for prefix and suffix"""
+
+        kind: str = "text"
+
+        def __init__(self, path: str):
+            super().__init__(path)
+            self.texts: dict[int, str] = {}
+            self.trigrams: dict[str, set[int]] = {}
+            self.terms: list[tuple[str, int]] = []
+            self.reversed_terms: list[tuple[str, int]] = []
+
+        @staticmethod
+        def split(text: str) -> set[str]:
+            return {text[i : i + 3] for i in range(len(text) - 2)}
+
+        def insert(self, selected_id: int, value: Any):
+            self.texts[selected_id] = text = str(value).lower()
+
+            for trigram in self.split(text):
+                self.trigrams.setdefault(trigram, set()).add(selected_id)
+
+            bisect.insort(self.terms, (text, selected_id))
+            bisect.insort(self.reversed_terms, (text[::-1], selected_id))
+
+        def discard(self, selected_id: int, value: Any):
+            text = self.texts.pop(selected_id)
+
+            for trigram in self.split(text):
+                if (bucket := self.trigrams.get(trigram)) is not None:
+                    bucket.discard(selected_id)
+
+                    if not bucket:
+                        del self.trigrams[trigram]
+
+            for entries, term in [
+                (self.terms, text),
+                (self.reversed_terms, text[::-1]),
+            ]:
+                i = bisect.bisect_left(entries, (term, selected_id))
+
+                if i < len(entries) and entries[i] == (term, selected_id):
+                    del entries[i]
+
+        def build(
+            self,
+            items: Iterable[tuple[int, dict[str, Any]]],
+            defaults: dict[str, Any],
+        ):
+            for selected_id, item in items:
+                self.values[selected_id] = value = Flexmeta.extract(
+                    item, self.path, defaults
+                )
+                self.texts[selected_id] = text = str(value).lower()
+
+                for trigram in self.split(text):
+                    self.trigrams.setdefault(trigram, set()).add(selected_id)
+
+            self.terms = sorted((v, k) for k, v in self.texts.items())
+            self.reversed_terms = sorted((v[::-1], k) for k, v in self.texts.items())
+
+        def starting(self, entries: list[tuple[str, int]], term: str) -> set[int]:
+            ids: set[int] = set()
+
+            for i in range(bisect.bisect_left(entries, (term,)), len(entries)):
+                if not entries[i][0].startswith(term):
+                    break
+
+                ids.add(entries[i][1])
+
+            return ids
+
+        def search(
+            self, operator: str, value: Any, sensitive: bool = True
+        ) -> Optional[set[int]]:
+            negate = operator.startswith("not_")
+            operator = operator.removeprefix("not_")
+
+            if not self.valid or not isinstance(value, str):
+                return None
+
+            if operator not in ("contains", "prefix", "suffix"):
+                return None
+
+            term = value.lower()
+
+            if operator == "prefix":
+                ids = self.starting(self.terms, term)
+            elif operator == "suffix":
+                ids = self.starting(self.reversed_terms, term[::-1])
+            elif len(term) < 3:
+                ids = {k for k, text in self.texts.items() if term in text}
+            else:
+                buckets = sorted(
+                    (self.trigrams.get(trigram, set()) for trigram in self.split(term)),
+                    key=len,
+                )
+                ids = {
+                    k
+                    for k in buckets[0].intersection(*buckets[1:])
+                    if term in self.texts[k]
+                }
+
+            if sensitive:
+                test = {
+                    "contains": lambda k: str(k).find(value) >= 0,
+                    "prefix": lambda k: str(k).startswith(value),
+                    "suffix": lambda k: str(k).endswith(value),
+                }[operator]
+                ids = {k for k in ids if test(self.values[k])}
+
+            return self.values.keys() - ids if negate else ids
+
+    class Journal:
+        def __init__(self, filename: str, flextable: "Flextable", next_id: int):
+            self.filename: str = filename
+            self.classname: str = flextable.__class__.__name__
+            self.count: int = 0
+            self.next_id: int = next_id
+            self.commits: list[tuple[str, int]] = []
+            self.deltas: int = 0
+            self.merged: int = 0
+
+        def __str__(self) -> str:
+            return f"Flexmeta.Journal(count={self.count}, next_id={self.next_id})"
+
+        def load(self) -> bool:
+            if (stamp := Flexmeta.stamp(self.filename)) is None:
+                return False
+
+            # the journal is only read again once it was replaced
+            cached = Flexmeta.flextable_journals.get(self.filename)
+
+            if cached is None or cached[0] != stamp:
+                with open(self.filename, "rb") as handle:
+                    if not isinstance(items := pickle.load(handle), dict):
+                        return True
+
+                cached = (stamp, items)
+                Flexmeta.flextable_journals[self.filename] = cached
+
+            items = cached[1]
+            self.count = items["count"]
+            self.next_id = items["next_id"]
+            self.classname = items["classname"]
+            self.commits = list(items["commits"])
+            self.deltas = items.get("deltas", 0)
+            self.merged = items.get("merged", 0)
+
+            return True
+
+        def save(self) -> bool:
+            if os.path.isdir(os.path.dirname(self.filename)):
+                journal = {
+                    "count": self.count,
+                    "next_id": self.next_id,
+                    "classname": self.classname,
+                    "commits": list(self.commits),
+                    "deltas": self.deltas,
+                    "merged": self.merged,
+                }
+                Flexmeta.dump(self.filename, journal)
+
+                if (stamp := Flexmeta.stamp(self.filename)) is not None:
+                    Flexmeta.flextable_journals[self.filename] = (stamp, journal)
+
+                return True
+            return False
+
+
+class Flextable(
+    metaclass=protect(
+        "flexmeta",
+        "_load",
+        "prop",
+        "accessor",
+        "clone",
+        "hydrate",
+        "commit",
+        "delete",
+        "select",
+        "acommit",
+        "adelete",
+        "aselect",
+    ),
+):
+    def __init__(self, flexmeta: Flexmeta):
+        self._flexmeta_uniqid_: str = flexmeta.uniqid
+        self.id: int = flexmeta.next_id()
+        self.uniqid: str = str(uuid.uuid5(uuid.NAMESPACE_OID, str(self.id)))
+        Flexmeta.register(self)
+
+    def __getitem__(self, name: str) -> Any:
+        return self.prop(name)
+
+    def __str__(self) -> str:
+        return f"{self.__class__.__name__}(flexmeta={self.flexmeta})"
+
+    def __hash__(self) -> int:
+        return hash(self.uniqid)
+
+    @property
+    def flexmeta(self) -> Flexmeta:
+        return Flexmeta.load(self._flexmeta_uniqid_)
+
+    @staticmethod
+    def _load(flextable: "Flextable", selected_id: int) -> Optional["Flextable"]:
+        return flextable.flexmeta.load_object(selected_id)
+
+    @staticmethod
+    async def _aload(flextable: "Flextable", selected_id: int) -> Optional["Flextable"]:
+        return await flextable.flexmeta.aload_object(selected_id)
+
+    def prop(self, name: str, args: list | tuple | dict = ()) -> Any:
+        return Flextable.accessor(name, args)(self)
+
+    @staticmethod
+    def accessor(name: str, args: list | tuple | dict = ()) -> Callable[[Any], Any]:
+        """Compiles a dotted attribute path, and the call of a method, into a getter"""
+        get = attrgetter(name)
+        names = name.split(".")
+
+        def walk(item: Any) -> Any:
+            for tname in names:
+                if item is None:
+                    return None
+
+                item = getattr(item, tname)
+
+            return item
+
+        def access(item: Any) -> Any:
+            try:
+                value = get(item)
+            except AttributeError:
+                value = walk(item)
+
+            if callable(value):
+                if isinstance(args, dict):
+                    return value(**args)
+
+                return value(*args)
+
+            return value
+
+        return access
+
+    def clone(self, items: dict = {}) -> "Flextable":
+        if items and isinstance(items, dict):
+            return self.hydrate([items])[0]
+
+        return type(self)()  # type: ignore
+
+    def hydrate(self, items: list[dict[str, Any]]) -> list["Flextable"]:
+        prototype = self.flexmeta.prototype()
+        klass = type(prototype)
+        defaults = prototype.__dict__
+        nested = [k for k, v in defaults.items() if isinstance(v, Flextable)]
+        flextables: list[Flextable] = []
+
+        for item in items:
+            flextable = klass.__new__(klass)
+            flextable.__dict__.update(defaults)
+
+            if not item.keys() >= defaults.keys():
+                missing = [k for k in defaults if k not in item or k in nested]
+            else:
+                missing = nested
+
+            for k in missing:
+                flextable.__dict__[k] = copy.deepcopy(defaults[k])
+
+            flextables.append(flextable.on_load(item))
+
+        return flextables
+
+    def commit(self) -> bool:
+        return self.flexmeta.save_object(self)
+
+    def delete(self) -> bool:
+        return self.flexmeta.delete_object(self.id)
+
+    def select(self, chunk_size: int = 0) -> "Flextable.Flexselect":
+        return self.flexmeta.select(self, chunk_size)
+
+    async def acommit(self) -> bool:
+        return await Flexmeta.run(self.commit)
+
+    async def adelete(self) -> bool:
+        return await Flexmeta.run(self.delete)
+
+    async def aselect(self, chunk_size: int = 0) -> "Flextable.Flexselect":
+        return await self.flexmeta.aselect(self, chunk_size)
+
+    def to_json(self, indent: Optional[int] = None) -> str:
+        def default(o: object) -> Any:
+            try:
+                return o.__dict__
+            except Exception:
+                return str(o)
+
+        return json.dumps(self.on_dump(), indent=indent, default=default)
+
+    def on_dump(self) -> dict[str, Any]:
+        items: dict[str, Any] = {}
+
+        for k, v in self.__dict__.items():
+            if isinstance(v, Flextable) and v != self:
+                items[k] = v.on_dump()
+            else:
+                items[k] = v
+
+        return items
+
+    def on_load(self, items: dict) -> "Flextable":
+        for k, v in [(k, v) for k, v in self.__dict__.items() if k in items]:
+            if isinstance(v, Flextable) and v != self:
+                setattr(self, k, v.on_load(items[k]))
+            else:
+                setattr(self, k, items[k])
+
+        return self
+
+    class Flexselect:
+        def __init__(
+            self,
+            flextable: "Flextable",
+            items: list[dict[str, Any]] = [],
+            indexes: dict[str, list[Flexmeta.Index]] = {},
+            columns: Optional[Flexmeta.Columns] = None,
+            flexmeta: Optional[Flexmeta] = None,
+        ):
+            self.flextable: Flextable = flextable
+            self.flexmeta: Flexmeta = (
+                flextable.flexmeta if flexmeta is None else flexmeta
+            )
+            self.columns: Optional[Flexmeta.Columns] = columns
+            # rows are kept as the stored dicts (or column positions) until returned
+            self.source: Sequence[Any] = list(items)
+            self.hydrated: dict[int, Flextable] = {}
+            self.plan: list[Callable[[Flextable], bool]] = []
+            self.indexes: dict[str, list[Flexmeta.Index]] = indexes
+            self.indexes_version: int = self.flexmeta.version() if indexes else 0
+            self.arrays: Optional[dict[Any, Any]] = None
+            self.partitions: Optional[list[Any]] = None
+            self.chunk_size: int = 0
+            self.orders: list[tuple[str, bool]] = []
+            self.limits: Optional[tuple[int, Optional[tuple[Any, int]]]] = None
+
+            if columns is not None:
+                self.source = range(columns.count)
+
+        def __getattr__(self, name: str) -> "Flextable.Flexselect.Statement":
+            if name.startswith("_"):
+                raise AttributeError(f"Flexselect has no attribute '{name}'")
+            elif hasattr(Flextable.Flexselect, name):
+                # only reached when the property itself raised an AttributeError
+                raise AttributeError(f"Flexselect property '{name}' failed")
+
+            return Flextable.Flexselect.Statement(self, name)
+
+        def __getitem__(self, name: str) -> "Flextable.Flexselect.Statement":
+            return Flextable.Flexselect.Statement(self, name)
+
+        def __len__(self) -> int:
+            return len(self.records)
+
+        def __iter__(self):
+            if self.chunk_size and not self.orders:
+                yield from map(self.hydrate, self.head(self.stream()))
+                return
+
+            for item in self.items:
+                yield item
+
+        @property
+        def records(self) -> list[Any]:
+            self.load_partitions()
+
+            if self.plan or self.chunk_size or self.orders or self.limits:
+                self.source = self.order(self.scan())
+                self.plan = []
+                self.arrays = None
+                self.chunk_size = 0
+                self.orders = []
+                self.limits = None
+            elif not isinstance(self.source, list):
+                self.source = list(self.source)
+
+            return self.source  # type: ignore
+
+        @records.setter
+        def records(self, records: list[Any]):
+            self.source = records
+            self.plan = []
+            self.arrays = None
+            self.partitions = None
+            self.chunk_size = 0
+            self.orders = []
+            self.limits = None
+
+        @property
+        def items(self) -> list["Flextable"]:
+            records = self.records
+
+            if self.columns is not None or not all(
+                isinstance(record, Flextable) for record in records
+            ):
+                self.source = self.promote(records)
+                self.columns = None
+                self.hydrated = {}
+                self.arrays = None
+
+            return self.records
+
+        @items.setter
+        def items(self, items: list["Flextable"]):
+            self.source = items
+            self.plan = []
+            self.columns = None
+            self.hydrated = {}
+            self.arrays = None
+            self.partitions = None
+            self.chunk_size = 0
+            self.orders = []
+            self.limits = None
+
+        def load_partitions(self):
+            if self.partitions is None:
+                return
+
+            items: list[dict[str, Any]] = []
+            partitions = self.get_partitions(self.partitions)
+
+            if Flexmeta.hooks:
+                Flexmeta.emit(
+                    "partitions",
+                    table=self.flexmeta.name_d,
+                    touched=len(partitions),
+                    total=len(self.partitions),
+                )
+
+            for partition in partitions:
+                items.extend(partition.load_all().values())
+
+            self.source = items
+            self.partitions = None
+
+        def get_partitions(self, values: list[Any]) -> list[Flexmeta]:
+            return [
+                self.flexmeta.get_partition(value)
+                for value in values
+                if all(
+                    self.prune(statement, value) is not False for statement in self.plan
+                )
+            ]
+
+        def stream(
+            self, stats: Optional[list[dict[str, Any]]] = None
+        ) -> Iterator[dict[str, Any]]:
+            plan = [self.measure(s, self.check(s), stats) for s in self.plan]
+            partitions = [self.flexmeta]
+
+            if self.flexmeta.partition:
+                values = list(self.flexmeta.get_partitions())
+                partitions = self.get_partitions(values)
+
+                if Flexmeta.hooks:
+                    Flexmeta.emit(
+                        "partitions",
+                        table=self.flexmeta.name_d,
+                        touched=len(partitions),
+                        total=len(values),
+                    )
+
+            for flexmeta in partitions:
+                for chunk in flexmeta.chunks(self.chunk_size):
+                    for row in chunk:
+                        if all(check(row) for check in plan):
+                            yield row
+
+                    # only the rows of the current chunk stay hydrated
+                    self.hydrated = {}
+
+        def prune(
+            self, statement: Callable[["Flextable"], bool], value: Any
+        ) -> Optional[bool]:
+            """Tests a statement on a partition value: True, False or None if it depends on the rows"""
+            if isinstance(statement, Flextable.Flexselect.Predicate):
+                if statement.args or statement.name != self.flexmeta.partition:
+                    return None
+
+                try:
+                    return bool(statement.test(value))
+                except Exception:
+                    return None
+
+            if not isinstance(statement, Flextable.Flexselect.Expression):
+                return None
+
+            results = [self.prune(operand, value) for operand in statement.operands]
+
+            if statement.kind == "not":
+                return None if results[0] is None else not results[0]
+            if statement.kind == "and":
+                return False if False in results else None if None in results else True
+
+            return True if True in results else None if None in results else False
+
+        def hydrate(self, record: Any) -> "Flextable":
+            if isinstance(record, Flextable):
+                return record
+
+            if self.columns is None:
+                if (selected_id := record["id"]) not in self.hydrated:
+                    self.hydrated[selected_id] = self.flextable.hydrate([record])[0]
+
+                return self.hydrated[selected_id]
+
+            if record not in self.hydrated:
+                n_item = self.flextable.hydrate([self.columns.row(record)])[0]
+                self.hydrated[record] = n_item
+
+            return self.hydrated[record]
+
+        def promote(self, records: list[Any]) -> list["Flextable"]:
+            """Hydrates the returned records, the row dicts in a single pass"""
+            started = time.perf_counter()
+
+            if self.columns is None:
+                rows = [
+                    record
+                    for record in records
+                    if isinstance(record, dict) and record["id"] not in self.hydrated
+                ]
+
+                for row, n_item in zip(rows, self.flextable.hydrate(rows)):
+                    self.hydrated[row["id"]] = n_item
+
+            items = [self.hydrate(record) for record in records]
+
+            if Flexmeta.hooks:
+                Flexmeta.emit(
+                    "hydrate",
+                    table=self.flexmeta.name_d,
+                    rows=len(items),
+                    seconds=time.perf_counter() - started,
+                )
+
+            return items
+
+        def accessor(
+            self, name: str, args: tuple | list | dict = ()
+        ) -> Callable[[Any], Any]:
+            columns = self.columns
+
+            if columns is None:
+                return self.row_accessor(name, args)
+
+            if not args and columns.has(name) and self.is_columnar():
+                if name in columns.files:
+                    return columns.column(name).__getitem__
+
+                return lambda record: columns.value(record, name)
+
+            get = Flextable.accessor(name, args)
+
+            return lambda record: get(self.hydrate(record))
+
+        def row_accessor(
+            self, name: str, args: tuple | list | dict = ()
+        ) -> Callable[[Any], Any]:
+            """Reads the plain attributes from the row dicts, and the other values from the hydrated rows"""
+            get = Flextable.accessor(name, args)
+            head, _, rest = name.partition(".")
+            defaults = self.flextable.flexmeta.prototype().__dict__
+            default = defaults.get(head)
+
+            if (
+                args
+                or not self.is_columnar()
+                or head not in defaults
+                or isinstance(default, Flextable)
+                or callable(default)
+            ):
+                return lambda record: get(self.hydrate(record))
+
+            get_rest = Flextable.accessor(rest) if rest else None
+
+            def access(record: Any) -> Any:
+                if isinstance(record, Flextable):
+                    return get(record)
+
+                value = record.get(head, default)
+
+                return value if get_rest is None else get_rest(value)
+
+            return access
+
+        def is_columnar(self) -> bool:
+            return type(self.flextable).on_load is Flextable.on_load
+
+        def check(
+            self, statement: Callable[["Flextable"], bool]
+        ) -> Callable[[Any], bool]:
+            if isinstance(statement, Flextable.Flexselect.Predicate):
+                get, test = (
+                    self.accessor(statement.name, statement.args),
+                    statement.test,
+                )
+                return lambda record: test(get(record))
+
+            if isinstance(statement, Flextable.Flexselect.Expression):
+                checks = [self.check(operand) for operand in statement.operands]
+
+                if statement.kind == "not":
+                    return lambda record: not checks[0](record)
+                if statement.kind == "and":
+                    return lambda record: all(check(record) for check in checks)
+
+                return lambda record: any(check(record) for check in checks)
+
+            return lambda record: statement(self.hydrate(record))
+
+        def scan(self) -> Iterator[Any]:
+            if not Flexmeta.hooks:
+                return self.evaluate()
+
+            stats: list[dict[str, Any]] = []
+
+            def observed() -> Iterator[Any]:
+                started, returned = time.perf_counter(), 0
+
+                try:
+                    for record in self.evaluate(stats):
+                        returned += 1
+                        yield record
+                finally:
+                    Flexmeta.emit(
+                        "scan",
+                        table=self.flexmeta.name_d,
+                        predicates=stats,
+                        returned=returned,
+                        seconds=time.perf_counter() - started,
+                    )
+
+            return observed()
+
+        def evaluate(
+            self, stats: Optional[list[dict[str, Any]]] = None
+        ) -> Iterator[Any]:
+            plan: list[Callable[[Any], bool]] = []
+            candidates: Optional[set[int]] = None
+            mask: Any = None
+            self.load_partitions()
+            source = self.source
+
+            if self.chunk_size:
+                yield from self.stream(stats)
+                return
+
+            if not self.plan:
+                yield from source
+                return
+
+            for statement in self.plan:
+                started = time.perf_counter()
+
+                if (ids := self.search(statement)) is not None:
+                    candidates = ids if candidates is None else candidates & ids
+                    method, scanned, returned = "index", 0, len(ids)
+                elif (n_mask := self.vectorize(statement)) is not None:
+                    mask = n_mask if mask is None else mask & n_mask
+                    method, scanned = "vector", len(source)
+                    returned = int(
+                        numpy.count_nonzero(numpy.broadcast_to(n_mask, scanned))
+                    )
+                else:
+                    plan.append(self.measure(statement, self.check(statement), stats))
+                    continue
+
+                if stats is not None:
+                    stats.append(
+                        {
+                            "predicate": str(statement),
+                            "method": method,
+                            "scanned": scanned,
+                            "returned": returned,
+                            "seconds": time.perf_counter() - started,
+                        }
+                    )
+
+            if candidates is not None and self.columns is not None:
+                if source == range(self.columns.count):
+                    positions = self.columns.positions()
+                    source = sorted(positions[i] for i in candidates if i in positions)
+                    candidates = None
+
+            if mask is not None:
+                if source is self.source:
+                    source = [source[i] for i in numpy.flatnonzero(mask).tolist()]
+                else:
+                    source = [record for record in source if mask[record]]
+
+            if not plan and candidates is None:
+                yield from source
+                return
+
+            get_id = self.accessor("id")
+
+            for record in source:
+                if candidates is not None and get_id(record) not in candidates:
+                    continue
+
+                if all(check(record) for check in plan):
+                    yield record
+
+        def measure(
+            self,
+            statement: Callable[["Flextable"], bool],
+            check: Callable[[Any], bool],
+            stats: Optional[list[dict[str, Any]]],
+        ) -> Callable[[Any], bool]:
+            """Counts the rows a check tests and keeps, when the scan is instrumented"""
+            if stats is None:
+                return check
+
+            counts: dict[str, Any] = {
+                "predicate": str(statement),
+                "method": "scan",
+                "scanned": 0,
+                "returned": 0,
+                "seconds": 0.0,
+            }
+            stats.append(counts)
+
+            def measured(record: Any) -> bool:
+                started = time.perf_counter()
+                result = check(record)
+                counts["scanned"] += 1
+                counts["returned"] += bool(result)
+                counts["seconds"] += time.perf_counter() - started
+
+                return result
+
+            return measured
+
+        def array(self, name: str, sensitive: bool = True) -> Any:
+            if self.arrays is None:
+                return None
+
+            if (name, sensitive) not in self.arrays:
+                if not sensitive:
+                    if (array := self.array(name)) is None or array.dtype.kind != "U":
+                        return None
+
+                    self.arrays[(name, sensitive)] = numpy.char.lower(array)
+                elif (
+                    self.columns is not None
+                    and name in self.columns.files
+                    and self.is_columnar()
+                    and (column := self.columns.column(name)).kind in "qd?"
+                ):
+                    self.arrays[(name, sensitive)] = numpy.asarray(column.values)
+                else:
+                    get = self.accessor(name)
+                    self.arrays[(name, sensitive)] = Flexmeta.vector(
+                        [get(record) for record in self.source]
+                    )
+
+            return self.arrays[(name, sensitive)]
+
+        def vectorize(self, statement: Callable[["Flextable"], bool]) -> Any:
+            """Evaluates a statement as a numpy mask over the whole table if possible"""
+            if numpy is None or self.arrays is None:
+                return None
+
+            if isinstance(statement, Flextable.Flexselect.Predicate):
+                return self.mask(statement)
+
+            if isinstance(statement, Flextable.Flexselect.Expression):
+                masks = [self.vectorize(operand) for operand in statement.operands]
+
+                if any(mask is None for mask in masks):
+                    return None
+                if statement.kind == "not":
+                    return ~masks[0]
+                if statement.kind == "and":
+                    return numpy.logical_and.reduce(masks)
+
+                return numpy.logical_or.reduce(masks)
+
+            return None
+
+        def mask(self, statement: "Flextable.Flexselect.Predicate") -> Any:
+            operator, value = statement.operator, statement.value
+            strings = ["prefix", "not_prefix", "suffix", "not_suffix"]
+            strings += ["contains", "not_contains"]
+
+            if statement.args:
+                return None
+
+            if callable(
+                getattr(type(self.flextable), statement.name.split(".")[0], None)
+            ):
+                return None
+
+            if (array := self.array(statement.name, statement.sensitive)) is None:
+                return None
+
+            kind = array.dtype.kind
+            values = value if operator in ["is_between", "is_not_between"] else [value]
+
+            if operator not in ["is_in", "is_not_in"]:
+                if not all(numpy.isscalar(v) or v is None for v in values):
+                    return None
+
+            try:
+                if operator in ["==", "!="] and kind in "biufU":
+                    mask = array == value if operator == "==" else array != value
+                elif operator in ["<", ">", "<=", ">="] and kind in "iufU":
+                    mask = {
+                        "<": numpy.less,
+                        ">": numpy.greater,
+                        "<=": numpy.less_equal,
+                        ">=": numpy.greater_equal,
+                    }[operator](array, value)
+                elif operator in ["is_between", "is_not_between"] and kind in "iufU":
+                    mask = (array >= value[0]) & (array <= value[1])
+                    mask = ~mask if operator == "is_not_between" else mask
+                elif operator in ["is_in", "is_not_in"] and kind in "biufU":
+                    types = (str,) if kind == "U" else (bool, int, float)
+                    values = [v for v in value if isinstance(v, types)]
+                    mask = numpy.isin(array, values)
+                    mask = ~mask if operator == "is_not_in" else mask
+                elif operator in ["is_true", "is_false"] and kind in "biufU":
+                    mask = (
+                        array == value if kind == "b" else numpy.zeros(len(array), bool)
+                    )
+                elif operator in ["is_null", "is_empty"] and kind in "biufU":
+                    mask = (
+                        array == ""
+                        if operator == "is_empty" and kind == "U"
+                        else numpy.zeros(len(array), bool)
+                    )
+                elif operator in ["is_not_null", "is_not_empty"] and kind in "biufU":
+                    mask = (
+                        array != ""
+                        if operator == "is_not_empty" and kind == "U"
+                        else numpy.ones(len(array), bool)
+                    )
+                elif operator in strings and kind == "U":
+                    if operator.endswith("prefix"):
+                        mask = numpy.char.startswith(array, value)
+                    elif operator.endswith("suffix"):
+                        mask = numpy.char.endswith(array, value)
+                    else:
+                        mask = numpy.char.find(array, value) >= 0
+
+                    mask = ~mask if operator.startswith("not_") else mask
+                else:
+                    return None
+            except (TypeError, ValueError):
+                return None
+
+            if not isinstance(mask, numpy.ndarray) or mask.shape != array.shape:
+                return None
+
+            return mask.astype(bool, copy=False)
+
+        def get_indexes(self, name: str) -> list[Flexmeta.Index]:
+            if not self.indexes or name not in self.indexes:
+                return []
+
+            if self.indexes_version != self.flexmeta.version():
+                return []
+
+            return [index for index in self.indexes[name] if index.valid]
+
+        def get_index(self, name: str, kind: str) -> Optional[Flexmeta.Index]:
+            for index in self.get_indexes(name):
+                if index.kind == kind:
+                    return index
+
+        def search(
+            self, statement: Callable[["Flextable"], bool]
+        ) -> Optional[set[int]]:
+            if not self.indexes:
+                return None
+
+            if isinstance(statement, Flextable.Flexselect.Predicate):
+                return self.search_predicate(statement)
+
+            if isinstance(statement, Flextable.Flexselect.Expression):
+                ids: set[int] = set()
+
+                if statement.kind == "not":
+                    if (n_ids := self.search(statement.operands[0])) is None:
+                        return None
+
+                    for name in self.indexes:
+                        for index in self.get_indexes(name):
+                            return index.values.keys() - n_ids
+
+                    return None
+
+                for n, operand in enumerate(statement.operands):
+                    if (n_ids := self.search(operand)) is None:
+                        return None
+
+                    if statement.kind == "or":
+                        ids |= n_ids
+                    else:
+                        ids = n_ids if n == 0 else ids & n_ids
+
+                return ids
+
+            return None
+
+        def search_predicate(
+            self, statement: "Flextable.Flexselect.Predicate"
+        ) -> Optional[set[int]]:
+            if statement.args:
+                return None
+
+            for index in self.get_indexes(statement.name):
+                if (
+                    n_ids := index.search(
+                        statement.operator, statement.value, statement.sensitive
+                    )
+                ) is not None:
+                    return n_ids
+
+        def empty(self):
+            self.records = []
+
+        def shuffle(self):
+            records = self.records
+            random.shuffle(records)
+            self.records = records
+
+        def count(self) -> int:
+            return len(self.records)
+
+        def compact(self, name: str = "") -> list[int | Any]:
+            get = self.accessor(name or "id")
+            return [get(record) for record in self.records]
+
+        def compact_dict(
+            self, name: str | list[str] = ""
+        ) -> dict[int | str, "Flextable"]:
+            if not name:
+                get_id = self.accessor("id")
+                return {get_id(record): self.hydrate(record) for record in self.records}
+
+            return {
+                k: self.hydrate(record) for k, record in self.compact_keys(name).items()
+            }
+
+        def compact_keys(self, name: str | list[str]) -> dict[int | str, Any]:
+            if isinstance(name, str):
+                name = [name]
+
+            gets = [self.accessor(n) for n in name]
+
+            return {
+                "_".join([str(get(record)) for get in gets]): record
+                for record in self.records
+            }
+
+        def distinct(self, name: str | list[str] = ""):
+            if isinstance(name, str) and (index := self.get_index(name, "hash")):
+                values, get_id = index.values, self.accessor("id")
+                self.records = list(
+                    {values[get_id(record)]: record for record in self.records}.values()
+                )
+            elif not name:
+                get_id = self.accessor("id")
+                self.records = list(
+                    {get_id(record): record for record in self.records}.values()
+                )
+            else:
+                self.records = list(self.compact_keys(name).values())
+
+        def map(
+            self, callback: Callable[["Flextable"], "Flextable"]
+        ) -> "Flextable.Flexselect":
+            if callable(callback):
+                self.items = list(map(callback, self.items))
+                self.indexes = {}
+
+            return self
+
+        def where(
+            self, *statements: "Flextable.Flexselect.Expression | list[Flextable]"
+        ):
+            ors: list[Callable[[Flextable], bool]] = []
+
+            for statement in statements:
+                if isinstance(statement, Flextable.Flexselect.Expression):
+                    ors.append(statement)
+                elif isinstance(statement, list):
+                    ids = {id(item) for item in statement}
+                    ors.append(lambda item, ids=ids: id(item) in ids)
+
+            if len(ors) == 1 and isinstance(ors[0], Flextable.Flexselect.Expression):
+                if ors[0].kind == "and":
+                    self.plan.extend(ors[0].operands)
+                    return
+
+            if len(ors) == 1:
+                self.plan.append(ors[0])
+            else:
+                self.plan.append(Flextable.Flexselect.Expression("or", ors))
+
+        def sort(self, name: str, desc: bool = False) -> "Flextable.Flexselect":
+            self.orders.append((name, desc))
+            return self
+
+        def limit(
+            self, count: int, after: Optional[tuple[Any, int]] = None
+        ) -> "Flextable.Flexselect":
+            """Keeps the first rows of the last sort, after the (value, id) of the last row of the previous page if given"""
+            self.limits = (count, after)
+            return self
+
+        def explain(self) -> dict[str, Any]:
+            """Describes how the query will run: the index lookups and vector masks are evaluated, the rows are not scanned"""
+            values: Optional[list[Any]] = self.partitions
+            source = "columnar" if self.columns is not None else "rows"
+            predicates: list[dict[str, Any]] = []
+            sorts: list[dict[str, Any]] = []
+
+            if self.chunk_size:
+                source = "stream"
+
+                if self.flexmeta.partition:
+                    values = list(self.flexmeta.get_partitions())
+            elif values is not None:
+                source = "partitions"
+
+            for statement in self.plan:
+                method = "scan"
+
+                if values and all(self.prune(statement, v) is not None for v in values):
+                    method = "partition"
+                elif not self.chunk_size and self.search(statement) is not None:
+                    method = "index"
+                elif not self.chunk_size and self.vectorize(statement) is not None:
+                    method = "vector"
+
+                predicates.append({"predicate": str(statement), "method": method})
+
+            for n, (name, desc) in enumerate(self.orders):
+                method = "sort"
+
+                if not self.chunk_size and self.get_index(name, "sorted") is not None:
+                    method = "index"
+                elif n == len(self.orders) - 1 and self.limits is not None:
+                    method = "heap"
+
+                sorts.append({"name": name, "desc": desc, "method": method})
+
+            return {
+                "table": self.flexmeta.name_d,
+                "source": source,
+                "rows": (
+                    None if source in ["stream", "partitions"] else len(self.source)
+                ),
+                "partitions": (
+                    None
+                    if values is None
+                    else {
+                        "touched": [
+                            value
+                            for value in values
+                            if all(
+                                self.prune(statement, value) is not False
+                                for statement in self.plan
+                            )
+                        ],
+                        "total": len(values),
+                    }
+                ),
+                "predicates": predicates,
+                "sort": sorts,
+                "limit": None if self.limits is None else self.limits[0],
+            }
+
+        def order(
+            self, records: Iterator[Any], count: Optional[int] = None
+        ) -> list[Any]:
+            after: Optional[tuple[Any, int]] = None
+
+            if self.limits is not None:
+                count = self.limits[0] if count is None else min(count, self.limits[0])
+                after = self.limits[1]
+
+            if not self.orders:
+                return list(itertools.islice(self.head(records), count))
+
+            for name, desc in self.orders[:-1]:
+                records = iter(self.sort_records(list(records), name, desc))
+
+            name, desc = self.orders[-1]
+
+            if count is None:
+                return self.sort_records(list(records), name, desc)
+
+            return self.top(records, name, desc, count, after)
+
+        def head(self, records: Iterator[Any]) -> Iterator[Any]:
+            if self.limits is None:
+                return records
+
+            if self.limits[1] is not None:
+                raise Exception("Flexselect.limit(after=...) requires a sort()")
+
+            return itertools.islice(records, self.limits[0])
+
+        def sort_records(self, records: list[Any], name: str, desc: bool) -> list[Any]:
+            if isinstance(
+                index := self.get_index(name, "sorted"), Flexmeta.SortedIndex
+            ):
+                get_id = self.accessor("id")
+                n_records = {get_id(record): record for record in records}
+                positions = {selected_id: n for n, selected_id in enumerate(n_records)}
+                ids = index.sort(positions, desc)
+
+                if len(ids) == len(records):
+                    return [n_records[i] for i in ids]
+
+            return sorted(records, key=self.accessor(name), reverse=desc)
+
+        def top(
+            self,
+            records: Iterator[Any],
+            name: str,
+            desc: bool,
+            count: int,
+            after: Optional[tuple[Any, int]] = None,
+        ) -> list[Any]:
+            """Returns the first rows of sort_records(), the rows of a same value keeping their previous order"""
+            get, get_id = self.accessor(name), self.accessor("id")
+            index = self.get_index(name, "sorted") if not self.chunk_size else None
+
+            if isinstance(index, Flexmeta.SortedIndex):
+                n_records = {get_id(record): record for record in records}
+                positions = {selected_id: n for n, selected_id in enumerate(n_records)}
+                entries, n_top = index.entries, []
+                start, stop = 0, len(entries)
+
+                if after is not None and desc:
+                    stop = bisect.bisect_right(entries, after[0], key=lambda e: e[0])
+                elif after is not None:
+                    start = bisect.bisect_left(entries, after[0], key=lambda e: e[0])
+
+                for value, group in itertools.groupby(
+                    (
+                        entries[position]
+                        for position in (
+                            range(stop - 1, start - 1, -1)
+                            if desc
+                            else range(start, stop)
+                        )
+                    ),
+                    key=lambda e: e[0],
+                ):
+                    ids = sorted(
+                        (i for _, i in group if i in positions),
+                        key=positions.__getitem__,
+                    )
+
+                    if after is not None and value == after[0]:
+                        ids = self.following(ids, after[1])
+
+                    n_top.extend(n_records[i] for i in ids[: count - len(n_top)])
+
+                    if len(n_top) >= count:
+                        break
+
+                return n_top
+
+            keyed: Iterator[tuple[Any, Any]] = (
+                (get(record), record) for record in records
+            )
+
+            if after is not None:
+                keyed = self.past(keyed, after, desc)
+
+            pick = heapq.nlargest if desc else heapq.nsmallest
+
+            # like sorted(), the heap keeps the order of the rows of a same value
+            return [e[1] for e in pick(count, keyed, key=lambda e: e[0])]
+
+        def past(
+            self, keyed: Iterator[tuple[Any, Any]], after: tuple[Any, int], desc: bool
+        ) -> Iterator[tuple[Any, Any]]:
+            """Skips the (value, row) pairs up to the (value, id) cursor"""
+            get_id = self.accessor("id")
+            value, selected_id = after
+            ties: Optional[list[tuple[Any, Any]]] = []
+
+            for e in keyed:
+                if e[0] == value:
+                    if ties is None:
+                        yield e
+                    elif get_id(e[1]) == selected_id:
+                        ties = None
+                    else:
+                        ties.append(e)
+                elif e[0] < value if desc else e[0] > value:
+                    yield e
+
+            if ties:
+                ids = set(self.following([get_id(e[1]) for e in ties], selected_id))
+                yield from (e for e in ties if get_id(e[1]) in ids)
+
+        @staticmethod
+        def following(ids: list[int], selected_id: int) -> list[int]:
+            """Returns the ids after the cursor row, or above its id if it is no longer selected"""
+            if selected_id in ids:
+                return ids[ids.index(selected_id) + 1 :]
+
+            return [i for i in ids if i > selected_id]
+
+        def find(self, selected_id: int) -> Optional["Flextable"]:
+            get_id = self.accessor("id")
+
+            for record in self.records:
+                if get_id(record) == selected_id:
+                    return self.hydrate(record)
+
+        def fetch_one(self) -> Optional["Flextable"]:
+            for record in (
+                self.order(self.scan(), 1) if self.orders else self.head(self.scan())
+            ):
+                return self.hydrate(record)
+
+        def fetch_all(self) -> list["Flextable"]:
+            return self.items
+
+        async def afetch_one(self) -> Optional["Flextable"]:
+            return await Flexmeta.run(self.fetch_one)
+
+        async def afetch_all(self) -> list["Flextable"]:
+            return await Flexmeta.run(self.fetch_all)
+
+        async def __aiter__(self) -> AsyncIterator["Flextable"]:
+            if self.chunk_size and not self.orders:
+                items = map(self.hydrate, self.head(self.stream()))
+                size = self.chunk_size
+
+                while chunk := await Flexmeta.run(list, itertools.islice(items, size)):
+                    for item in chunk:
+                        yield item
+                return
+
+            for item in await self.afetch_all():
+                yield item
+
+        def paginate(
+            self, current: int = 0, items_per_page: int = 10, nb_buttons: int = 11
+        ) -> PaginateT:
+            buttons: list[int] = []
+            paginations: list[tuple[int, str, bool]] = []
+
+            if current <= 0 or items_per_page <= 0:
+                return PaginateT(self.count(), paginations)
+
+            total_item, records, last_records = 0, [], []
+            offset = (current - 1) * items_per_page
+
+            if self.orders:
+                scanned = [0]
+
+                def counted(n_records: Iterator[Any]) -> Iterator[Any]:
+                    for record in n_records:
+                        scanned[0] += 1
+                        yield record
+
+                records = self.order(counted(self.scan()), offset + items_per_page)
+                total_item = scanned[0]
+
+                if self.limits is not None:
+                    total_item = min(total_item, self.limits[0])
+
+                if total_item > 0:
+                    last = (math.ceil(total_item / items_per_page) - 1) * items_per_page
+
+                    if offset >= total_item:
+                        last_records = self.order(self.scan(), total_item)[last:]
+
+                records = records[offset:]
+            else:
+                for record in self.head(self.scan()):
+                    if total_item % items_per_page == 0:
+                        last_records = []
+
+                    if offset <= total_item < offset + items_per_page:
+                        records.append(record)
+
+                    last_records.append(record)
+                    total_item += 1
+
+            if total_item <= 0:
+                self.records = []
+                return PaginateT(total_item, paginations)
+
+            if current > (max_button := math.ceil(total_item / items_per_page)):
+                current = max_button
+                records = last_records
+
+            self.records = records
+
+            if nb_buttons >= max_button:
+                nb_buttons = max_button
+
+            if current <= nb_buttons / 2:
+                buttons = [i + 1 for i in range(0, nb_buttons)]
+            elif current > max_button - (nb_buttons / 2):
+                buttons = [i + 1 for i in range(max_button - nb_buttons, max_button)]
+            else:
+                buttons = [
+                    i + 1
+                    for i in range(
+                        current - math.ceil(nb_buttons / 2),
+                        current + math.floor(nb_buttons / 2),
+                    )
+                ]
+
+            if not buttons:
+                return PaginateT(total_item, paginations)
+
+            for n in buttons:
+                paginations.append((n, str(n), n == current))
+
+            if paginations[0][0] > 1:
+                paginations.insert(0, (1, "1 ... ", False))
+
+            if paginations[-1][0] < max_button:
+                paginations.append((max_button, f" ... {max_button}", False))
+
+            return PaginateT(total_item, paginations)
+
+        def extend(self, select: "Flextable.Flexselect"):
+            self.items = list(set(select.items) | set(self.items))
+            self.indexes = {}
+
+        def union_join(
+            self,
+            name: str,
+            select: "Flextable.Flexselect",
+            using: str | list[str],
+            on: str | list[str] = "",
+            many: bool = False,
+        ) -> "Flextable.Flexselect":
+            return self.join(name, select, using, on, "union", many)
+
+        def left_join(
+            self,
+            name: str,
+            select: "Flextable.Flexselect",
+            using: str | list[str],
+            on: str | list[str] = "",
+            many: bool = False,
+        ) -> "Flextable.Flexselect":
+            return self.join(name, select, using, on, "left", many)
+
+        def inner_join(
+            self,
+            name: str,
+            select: "Flextable.Flexselect",
+            using: str | list[str],
+            on: str | list[str] = "",
+            many: bool = False,
+        ) -> "Flextable.Flexselect":
+            return self.join(name, select, using, on, "inner", many)
+
+        def join(
+            self,
+            name: str,
+            select: "Flextable.Flexselect",
+            using: str | list[str],
+            on: str | list[str] = "",
+            how: str = "left",
+            many: bool = False,
+        ) -> "Flextable.Flexselect":
+            """Sets on `name` the rows of `select` matching each row, with a hash table on the smaller side"""
+            if how not in ("left", "inner", "union"):
+                raise Exception(f"Flexselect.join(): unknown join {how!r}")
+
+            left, right = self.records, select.records
+            left_key, right_key = self.key(on), select.key(using)
+            matches: dict[int, list[Any]] = {}
+
+            if len(right) <= len(left):
+                table: dict[Any, list[Any]] = {}
+
+                for record in right:
+                    table.setdefault(right_key(record), []).append(record)
+
+                for n, record in enumerate(left):
+                    if (k := left_key(record)) in table:
+                        matches[n] = table[k]
+            else:
+                positions: dict[Any, list[int]] = {}
+
+                for n, record in enumerate(left):
+                    positions.setdefault(left_key(record), []).append(n)
+
+                for record in right:
+                    for n in positions.get(right_key(record), ()):
+                        matches.setdefault(n, []).append(record)
+
+            items: list["Flextable"] = []
+
+            for n, record in enumerate(left):
+                if how == "inner" and n not in matches:
+                    continue
+
+                rows = [select.hydrate(r) for r in matches.get(n, [])]
+                item = self.hydrate(record)
+                setattr(item, name, rows if many else rows[-1] if rows else None)
+                items.append(item)
+
+            if how == "union":
+                missing = {right_key(record) for record in right}
+                missing -= {left_key(record) for record in left}
+
+                if missing:
+                    n_select = self.flextable.select()
+
+                    if isinstance(on, str):
+                        n_select.where(n_select[on or "id"].is_in(list(missing)))
+                    else:
+                        n_select.where(n_select[on[0]].is_in([k[0] for k in missing]))
+
+                    n_key = n_select.key(on)
+                    n_select.records = [
+                        record
+                        for record in n_select.records
+                        if n_key(record) in missing
+                    ]
+                    n_select.join(name, select, using, on, "inner", many)
+                    items.extend(n_select.items)
+
+            self.items = items
+
+            return self
+
+        def group_by(self, *names: str) -> "Flextable.Flexselect.Grouping":
+            return Flextable.Flexselect.Grouping(self, list(names))
+
+        def aggregated(
+            self, names: list[str]
+        ) -> tuple[Iterable[Any], Callable[[str], Callable[[Any], Any]]]:
+            """Returns the rows to aggregate and their accessor, reading the stored row dicts when streaming"""
+            if self.chunk_size and not (self.plan or self.orders or self.limits):
+                defaults = self.flexmeta.prototype().__dict__
+                heads = [name.split(".")[0] for name in names]
+
+                # the row dicts are read like the scan reads them, with the defaults of the missing keys
+                if self.is_columnar() and all(
+                    head in defaults
+                    and not isinstance(defaults[head], Flextable)
+                    and not callable(defaults[head])
+                    for head in heads
+                ):
+                    rows = itertools.chain.from_iterable(
+                        self.flexmeta.chunks(self.chunk_size)
                     )
-                    == 0
+                    return rows, self.row_accessor
+
+            if self.orders or self.limits:
+                return self.records, self.accessor
+
+            return self.scan(), self.accessor
+
+        def key(self, name: str | list[str]) -> Callable[[Any], Any]:
+            """Returns the join key of a record: a value, or a tuple of values for several names"""
+            if isinstance(name, str):
+                return self.accessor(name or "id")
+
+            gets = [self.accessor(n) for n in name]
+
+            return lambda record: tuple(get(record) for get in gets)
+
+        class Grouping:
+            """Aggregates the rows of a select by the values of one or more attributes"""
+
+            functions = ("count", "sum", "min", "max", "avg", "count_distinct")
+
+            def __init__(self, flexselect: "Flextable.Flexselect", names: list[str]):
+                self.flexselect: Flextable.Flexselect = flexselect
+                self.names: list[str] = names
+
+            def agg(
+                self, **aggregations: str | tuple[str, str]
+            ) -> list[dict[str, Any]]:
+                """Computes the aggregations, given as "count" or (function, name), in a single pass"""
+                functions: list[tuple[str, str, str]] = []
+
+                for alias, aggregation in aggregations.items():
+                    if isinstance(aggregation, str):
+                        function, name = aggregation, ""
+                    else:
+                        function, name = aggregation
+
+                    if function not in self.functions:
+                        raise Exception(
+                            f"Flexselect.agg(): unknown function {function!r}"
+                        )
+                    if not name and function != "count":
+                        raise Exception(
+                            f"Flexselect.agg(): {function!r} requires a name"
+                        )
+
+                    functions.append((alias, function, name))
+
+                records, accessor = self.flexselect.aggregated(
+                    self.names + [name for _, _, name in functions if name]
+                )
+                keys = [accessor(name) for name in self.names]
+                gets = [
+                    (function, accessor(name) if name else None)
+                    for _, function, name in functions
                 ]
+                groups: dict[tuple, list[Any]] = {}
+
+                for record in records:
+                    key = tuple(get(record) for get in keys)
+
+                    if (states := groups.get(key)) is None:
+                        states = groups[key] = [
+                            self.initial(function) for function, _ in gets
+                        ]
+
+                    for n, (function, get) in enumerate(gets):
+                        if get is None:
+                            states[n] += 1
+                        elif (value := get(record)) is None:
+                            continue
+                        elif function == "count":
+                            states[n] += 1
+                        elif function == "sum":
+                            states[n] += value
+                        elif function == "min":
+                            if states[n] is None or value < states[n]:
+                                states[n] = value
+                        elif function == "max":
+                            if states[n] is None or value > states[n]:
+                                states[n] = value
+                        elif function == "avg":
+                            states[n][0] += value
+                            states[n][1] += 1
+                        else:
+                            states[n].add(value)
+
+                results: list[dict[str, Any]] = []
+
+                for key, states in groups.items():
+                    result = dict(zip(self.names, key))
+
+                    for (alias, function, _), state in zip(functions, states):
+                        if function == "avg":
+                            state = state[0] / state[1] if state[1] else None
+                        elif function == "count_distinct":
+                            state = len(state)
+
+                        result[alias] = state
+
+                    results.append(result)
+
+                return results
+
+            @staticmethod
+            def initial(function: str) -> Any:
+                if function in ("count", "sum"):
+                    return 0
+                if function == "avg":
+                    return [0, 0]
+                if function == "count_distinct":
+                    return set()
+
+                return None
+
+        class Expression:
+            """Combines predicates with &, | and ~ into a single where() statement"""
+
+            def __init__(
+                self, kind: str, operands: list[Callable[["Flextable"], bool]]
+            ):
+                self.kind: str = kind
+                self.operands: list[Callable[["Flextable"], bool]] = []
+
+                for operand in operands:
+                    if isinstance(operand, Flextable.Flexselect.Expression):
+                        if operand.kind == kind and kind != "not":
+                            self.operands.extend(operand.operands)
+                            continue
+
+                    self.operands.append(operand)
+
+            def __str__(self) -> str:
+                if self.kind == "not":
+                    return f"~{self.operands[0]}"
+
+                operands = f" {'&' if self.kind == 'and' else '|'} ".join(
+                    map(str, self.operands)
+                )
+                return f"({operands})"
+
+            def __call__(self, item: "Flextable") -> bool:
+                if self.kind == "not":
+                    return not self.operands[0](item)
+                if self.kind == "and":
+                    return all(operand(item) for operand in self.operands)
+
+                return any(operand(item) for operand in self.operands)
+
+            def __and__(
+                self, other: "Flextable.Flexselect.Expression"
+            ) -> "Flextable.Flexselect.Expression":
+                return Flextable.Flexselect.Expression("and", [self, other])
+
+            def __or__(
+                self, other: "Flextable.Flexselect.Expression"
+            ) -> "Flextable.Flexselect.Expression":
+                return Flextable.Flexselect.Expression("or", [self, other])
+
+            def __invert__(self) -> "Flextable.Flexselect.Expression":
+                return Flextable.Flexselect.Expression("not", [self])
+
+        class Predicate(Expression):
+            def __init__(
+                self,
+                statement: "Flextable.Flexselect.Statement",
+                operator: str,
+                value: Any,
+                test: Callable[[Any], bool],
+                sensitive: bool = True,
+            ):
+                self.name: str = statement.name
+                self.args: tuple | list | dict = statement.args
+                self.operator: str = operator
+                self.value: Any = value
+                self.test: Callable[[Any], bool] = test
+                self.sensitive: bool = sensitive
+                self.kind: str = "predicate"
+                self.operands: list[Callable[["Flextable"], bool]] = []
+                self.get: Callable[[Any], Any] = Flextable.accessor(
+                    self.name, self.args
+                )
+
+            def __str__(self) -> str:
+                return f'Predicate(name="{self.name}", operator="{self.operator}", value={self.value!r})'
+
+            def __call__(self, item: "Flextable") -> bool:
+                return self.test(self.get(item))
+
+            def __reduce__(self) -> tuple:
+                args = (self.name, self.args, self.operator, self.value, self.sensitive)
+                return Flextable.Flexselect.Predicate.build, args
+
+            @staticmethod
+            def build(
+                name: str,
+                args: tuple | list | dict,
+                operator: str,
+                value: Any,
+                sensitive: bool = True,
+            ) -> "Flextable.Flexselect.Predicate":
+                statement = Flextable.Flexselect.Statement(None, name, args)
+                operators = {"==": "eq", "!=": "ne", "<": "lt", ">": "gt"}
+                operators.update({"<=": "le", ">=": "ge"})
+
+                if operator in operators:
+                    return getattr(statement, f"__{operators[operator]}__")(value)
+                if value is None or operator in ["is_true", "is_false"]:
+                    return getattr(statement, operator)()
+                if isinstance(value, str):
+                    return getattr(statement, operator)(value, sensitive)
+
+                return getattr(statement, operator)(value)
+
+        class Statement:
+            def __init__(
+                self,
+                flexselect: Optional["Flextable.Flexselect"],
+                name: str,
+                args: tuple | list | dict = (),
+            ):
+                self.name: str = name
+                self.args: tuple | list | dict = args
+                self.flexselect: Optional["Flextable.Flexselect"] = flexselect
+
+            def __call__(self, *args, **kwargs):
+                self.args = args or kwargs
+                return self
+
+            def predicate(
+                self,
+                operator: str,
+                value: Any,
+                test: Callable[[Any], bool],
+                sensitive: bool = True,
+            ) -> "Flextable.Flexselect.Predicate":
+                return Flextable.Flexselect.Predicate(
+                    self, operator, value, test, sensitive
+                )
+
+            def __eq__(self, value: Any) -> "Flextable.Flexselect.Predicate":  # type: ignore
+                return self.predicate("==", value, lambda k: k == value)
+
+            def __ne__(self, value: Any) -> "Flextable.Flexselect.Predicate":  # type: ignore
+                return self.predicate("!=", value, lambda k: k != value)
+
+            def __lt__(self, value: Any) -> "Flextable.Flexselect.Predicate":
+                return self.predicate("<", value, lambda k: k < value)
+
+            def __gt__(self, value: Any) -> "Flextable.Flexselect.Predicate":
+                return self.predicate(">", value, lambda k: k > value)
+
+            def __le__(self, value: Any) -> "Flextable.Flexselect.Predicate":
+                return self.predicate("<=", value, lambda k: k <= value)
+
+            def __ge__(self, value: Any) -> "Flextable.Flexselect.Predicate":
+                return self.predicate(">=", value, lambda k: k >= value)
+
+            def is_true(self) -> "Flextable.Flexselect.Predicate":
+                return self.predicate("is_true", True, lambda k: k is True)
+
+            def is_false(self) -> "Flextable.Flexselect.Predicate":
+                return self.predicate("is_false", False, lambda k: k is False)
+
+            def is_null(self) -> "Flextable.Flexselect.Predicate":
+                return self.predicate("is_null", None, lambda k: k is None)
+
+            def is_not_null(self) -> "Flextable.Flexselect.Predicate":
+                return self.predicate("is_not_null", None, lambda k: k is not None)
+
+            def is_empty(self) -> "Flextable.Flexselect.Predicate":
+                return self.predicate("is_empty", None, lambda k: k in [None, ""])
+
+            def is_not_empty(self) -> "Flextable.Flexselect.Predicate":
+                return self.predicate(
+                    "is_not_empty", None, lambda k: k not in [None, ""]
+                )
+
+            def is_between(
+                self, item: tuple[int, int]
+            ) -> "Flextable.Flexselect.Predicate":
+                return self.predicate(
+                    "is_between", item, lambda k: k >= item[0] and k <= item[1]
+                )
+
+            def is_not_between(
+                self, item: tuple[int, int]
+            ) -> "Flextable.Flexselect.Predicate":
+                return self.predicate(
+                    "is_not_between",
+                    item,
+                    lambda k: not (k >= item[0] and k <= item[1]),
+                )
+
+            def is_in(self, pattern: list[Any]) -> "Flextable.Flexselect.Predicate":
+                pattern = set(pattern)  # type: ignore
+                return self.predicate("is_in", pattern, lambda k: k in pattern)
+
+            def is_not_in(self, pattern: list[Any]) -> "Flextable.Flexselect.Predicate":
+                pattern = set(pattern)  # type: ignore
+                return self.predicate("is_not_in", pattern, lambda k: k not in pattern)
+
+            def is_intersect(
+                self, pattern: list[Any]
+            ) -> "Flextable.Flexselect.Predicate":
+                pattern = set(pattern)  # type: ignore
+                return self.predicate(
+                    "is_intersect", pattern, lambda k: any(p in k for p in pattern)
+                )
+
+            def is_not_intersect(
+                self, pattern: list[Any]
+            ) -> "Flextable.Flexselect.Predicate":
+                pattern = set(pattern)  # type: ignore
+                return self.predicate(
+                    "is_not_intersect",
+                    pattern,
+                    lambda k: any(p not in k for p in pattern),
+                )
+
+            def is_full_intersect(
+                self, pattern: list[Any]
+            ) -> "Flextable.Flexselect.Predicate":
+                pattern = set(pattern)  # type: ignore
+                return self.predicate(
+                    "is_full_intersect",
+                    pattern,
+                    lambda k: all(p in k for p in pattern),
+                )
+
+            def is_not_full_intersect(
+                self, pattern: list[Any]
+            ) -> "Flextable.Flexselect.Predicate":
+                pattern = set(pattern)  # type: ignore
+                return self.predicate(
+                    "is_not_full_intersect",
+                    pattern,
+                    lambda k: not any(p in k for p in pattern),
+                )
 
             def prefix(
                 self, substring: str, sensitive: bool = False
-            ) -> list["Flextable"]:
+            ) -> "Flextable.Flexselect.Predicate":
                 if sensitive:
-                    return [
-                        e
-                        for e in self.items
-                        if str(e.prop(self.name, self.args)).startswith(substring)
-                    ]
-                return [
-                    e
-                    for e in self.items
-                    if str(e.prop(self.name, self.args))
-                    .lower()
-                    .startswith(substring.lower())
-                ]
+                    return self.predicate(
+                        "prefix", substring, lambda k: str(k).startswith(substring)
+                    )
+
+                substring = substring.lower()
+                return self.predicate(
+                    "prefix",
+                    substring,
+                    lambda k: str(k).lower().startswith(substring),
+                    False,
+                )
 
             def not_prefix(
                 self, substring: str, sensitive: bool = False
-            ) -> list["Flextable"]:
+            ) -> "Flextable.Flexselect.Predicate":
                 if sensitive:
-                    return [
-                        e
-                        for e in self.items
-                        if not str(e.prop(self.name, self.args)).startswith(substring)
-                    ]
-                return [
-                    e
-                    for e in self.items
-                    if not str(e.prop(self.name, self.args))
-                    .lower()
-                    .startswith(substring.lower())
-                ]
+                    return self.predicate(
+                        "not_prefix",
+                        substring,
+                        lambda k: not str(k).startswith(substring),
+                    )
+
+                substring = substring.lower()
+                return self.predicate(
+                    "not_prefix",
+                    substring,
+                    lambda k: not str(k).lower().startswith(substring),
+                    False,
+                )
 
             def suffix(
                 self, substring: str, sensitive: bool = False
-            ) -> list["Flextable"]:
+            ) -> "Flextable.Flexselect.Predicate":
                 if sensitive:
-                    return [
-                        e
-                        for e in self.items
-                        if str(e.prop(self.name, self.args)).endswith(substring)
-                    ]
-                return [
-                    e
-                    for e in self.items
-                    if str(e.prop(self.name, self.args))
-                    .lower()
-                    .endswith(substring.lower())
-                ]
+                    return self.predicate(
+                        "suffix", substring, lambda k: str(k).endswith(substring)
+                    )
+
+                substring = substring.lower()
+                return self.predicate(
+                    "suffix",
+                    substring,
+                    lambda k: str(k).lower().endswith(substring),
+                    False,
+                )
 
             def not_suffix(
                 self, substring: str, sensitive: bool = False
-            ) -> list["Flextable"]:
+            ) -> "Flextable.Flexselect.Predicate":
                 if sensitive:
-                    return [
-                        e
-                        for e in self.items
-                        if not str(e.prop(self.name, self.args)).endswith(substring)
-                    ]
-                return [
-                    e
-                    for e in self.items
-                    if not str(e.prop(self.name, self.args))
-                    .lower()
-                    .endswith(substring.lower())
-                ]
+                    return self.predicate(
+                        "not_suffix",
+                        substring,
+                        lambda k: not str(k).endswith(substring),
+                    )
+
+                substring = substring.lower()
+                return self.predicate(
+                    "not_suffix",
+                    substring,
+                    lambda k: not str(k).lower().endswith(substring),
+                    False,
+                )
 
             def contains(
                 self, substring: str, sensitive: bool = False
-            ) -> list["Flextable"]:
+            ) -> "Flextable.Flexselect.Predicate":
                 if sensitive:
-                    return [
-                        e
-                        for e in self.items
-                        if str(e.prop(self.name, self.args)).find(substring) >= 0
-                    ]
+                    return self.predicate(
+                        "contains", substring, lambda k: str(k).find(substring) >= 0
+                    )
 
-                return [
-                    e
-                    for e in self.items
-                    if str(e.prop(self.name, self.args)).lower().find(substring.lower())
-                    >= 0
-                ]
+                substring = substring.lower()
+                return self.predicate(
+                    "contains",
+                    substring,
+                    lambda k: str(k).lower().find(substring) >= 0,
+                    False,
+                )
 
             def not_contains(
                 self, substring: str, sensitive: bool = False
-            ) -> list["Flextable"]:
+            ) -> "Flextable.Flexselect.Predicate":
                 if sensitive:
-                    return [
-                        e
-                        for e in self.items
-                        if not str(e.prop(self.name, self.args)).find(substring) >= 0
-                    ]
+                    return self.predicate(
+                        "not_contains",
+                        substring,
+                        lambda k: not str(k).find(substring) >= 0,
+                    )
 
-                return [
-                    e
-                    for e in self.items
-                    if not str(e.prop(self.name, self.args))
-                    .lower()
-                    .find(substring.lower())
-                    >= 0
-                ]
+                substring = substring.lower()
+                return self.predicate(
+                    "not_contains",
+                    substring,
+                    lambda k: not str(k).lower().find(substring) >= 0,
+                    False,
+                )
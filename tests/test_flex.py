@@ -0,0 +1,372 @@
+import sys
+import time
+import random
+import multiprocessing
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from app.libs.flex import Flexmeta, Flextable  # noqa: E402
+
+fork = pytest.mark.skipif(
+    "fork" not in multiprocessing.get_all_start_methods(),
+    reason="the concurrent tests fork the writers",
+)
+
+
+class Person(Flextable):
+    table: str = "persons"
+    options: dict[str, Any] = {}
+
+    def __init__(self):
+        super().__init__(Flexmeta(self, self.table, **self.options))
+        self.name: str = ""
+        self.year: int = 0
+
+
+class IndexedPerson(Person):
+    options = {"indexes": {"year": ["hash", "sorted"]}}
+
+
+class ColumnarPerson(Person):
+    options = {"snapshot": "columnar", "indexes": {"year": ["hash", "sorted"]}}
+
+
+class Contact:
+    def __init__(self, mail: str = ""):
+        self.mail: str = mail
+
+
+class CodecPerson(Person):
+    def __init__(self):
+        super().__init__()
+        self.contact: Contact = Contact()
+        self.extra: dict[str, Any] = {}
+
+
+CONFIGS = {
+    "pickle": {},
+    "columnar": {"snapshot": "columnar"},
+    "segment": {"storage": "segment"},
+    "indexed": {"indexes": {"year": ["hash", "sorted"], "name": ["hash"]}},
+    "partitioned": {"partition": "year"},
+}
+
+QUERIES = [
+    (lambda s: s.year == 3, lambda year: year == 3),
+    (lambda s: s.year.is_in([1, 2]), lambda year: year in (1, 2)),
+    (lambda s: s.year >= 7, lambda year: year >= 7),
+]
+
+
+@pytest.fixture(autouse=True)
+def root(tmp_path: Path) -> Path:
+    Flexmeta.setPath(tmp_path)
+    return tmp_path
+
+
+def mismatches(klass: type[Person]) -> int:
+    """Counts the index lookups whose rows differ from a scan of the same table"""
+    count = 0
+
+    with klass().flexmeta.lock():
+        rows = klass().select().fetch_all()
+
+        for where, test in QUERIES:
+            select = klass().select()
+            select.where(where(select))
+            ids = sorted(person.id for person in select.fetch_all())
+            count += ids != sorted(row.id for row in rows if test(row.year))
+
+    return count
+
+
+def write(klass: type[Person], seed: int, barrier: Any) -> int:
+    r = random.Random(seed)
+
+    for _ in range(30):
+        person = klass()
+        person.year = r.randint(0, 9)
+        person.commit()
+
+        for where, _ in QUERIES:
+            select = klass().select()
+            select.where(where(select))
+            select.fetch_all()
+
+    barrier.wait()
+
+    return mismatches(klass)
+
+
+@fork
+@pytest.mark.parametrize("klass", [IndexedPerson, ColumnarPerson])
+def test_indexes_match_scan_with_concurrent_writers(klass: type[Person]):
+    klass().commit()
+    klass().select().fetch_all()
+    context = multiprocessing.get_context("fork")
+    barrier = context.Manager().Barrier(4)
+
+    with context.Pool(4) as pool:
+        counts = pool.starmap(write, [(klass, seed, barrier) for seed in range(4)])
+
+    assert counts == [0, 0, 0, 0]
+    assert mismatches(klass) == 0
+    assert klass().select().count() == 121
+
+
+@fork
+def test_column_indexes_follow_a_merge_by_another_process(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    for year in [1, 3]:
+        person = ColumnarPerson()
+        person.year = year
+        person.commit()
+
+    ColumnarPerson().select().fetch_all()
+    person = ColumnarPerson()
+    person.year = 3
+    person.commit()
+    merge_columns = Flexmeta.merge_columns
+    context = multiprocessing.get_context("fork")
+
+    def merged_by_another_process(flexmeta: Flexmeta):
+        # the other process merges the journal once this one has seen its commits
+        monkeypatch.setattr(Flexmeta, "merge_columns", merge_columns)
+        process = context.Process(target=lambda: ColumnarPerson().select().fetch_all())
+        process.start()
+        process.join()
+        merge_columns(flexmeta)
+
+    monkeypatch.setattr(Flexmeta, "merge_columns", merged_by_another_process)
+    select = ColumnarPerson().select()
+    select.where(select.year == 3)
+
+    assert len(select.fetch_all()) == 2
+    assert mismatches(ColumnarPerson) == 0
+
+
+def commit(year: int):
+    person = IndexedPerson()
+    person.year = year
+    person.commit()
+    IndexedPerson().select().fetch_all()
+
+
+@fork
+def test_delta_appended_by_another_process_reads_only_the_tail():
+    for year in range(100):
+        commit(year % 10)
+
+    flexmeta = IndexedPerson().flexmeta
+    stamp = flexmeta.stamp_select()
+    context = multiprocessing.get_context("fork")
+    process = context.Process(target=commit, args=(3,))
+    process.start()
+    process.join()
+
+    with Flexmeta.profile() as profile:
+        rows = IndexedPerson().select().fetch_all()
+
+    reads = [
+        data["bytes"] for event, data in profile.events if event == "read_snapshot"
+    ]
+
+    assert flexmeta.stamp_select()[:2] == stamp[:2]
+    assert len(rows) == 101
+    assert reads == [flexmeta.stamp_select()[2] - stamp[2]]
+    assert mismatches(IndexedPerson) == 0
+
+
+def hold_shared_lock(locked: Any, released: Any):
+    with Person().flexmeta.lock().shared():
+        locked.set()
+        released.wait(10)
+
+
+@fork
+def test_reads_without_commits_share_the_lock():
+    for year in range(3):
+        person = Person()
+        person.year = year
+        person.commit()
+
+    Person().select().fetch_all()
+    context = multiprocessing.get_context("fork")
+    locked, released = context.Event(), context.Event()
+    process = context.Process(target=hold_shared_lock, args=(locked, released))
+    process.start()
+    locked.wait(10)
+    Flexmeta.flextable_selects.clear()
+    started = time.perf_counter()
+    rows = Person().select().fetch_all()
+    seconds = time.perf_counter() - started
+    released.set()
+    process.join()
+
+    assert len(rows) == 3 and seconds < 5
+    assert not Person().flexmeta.lock().exclusive
+
+
+def test_select_does_not_read_internal_or_failed_properties_as_columns(
+    monkeypatch: pytest.MonkeyPatch,
+):
+    Person().commit()
+    select = Person().select()
+
+    def fail(self: Any):
+        raise AttributeError("missing partition")
+
+    monkeypatch.setattr(Flextable.Flexselect, "load_partitions", fail)
+
+    for name in ["records", "items", "_cache", "__deepcopy__"]:
+        with pytest.raises(AttributeError):
+            getattr(select, name)
+
+    assert isinstance(select.year, Flextable.Flexselect.Statement)
+
+
+@pytest.mark.parametrize("codec", ["marshal", "binary"])
+def test_codec_keeps_user_dicts_with_the_class_key(
+    codec: str, monkeypatch: pytest.MonkeyPatch
+):
+    monkeypatch.setattr(CodecPerson, "options", {"codec": codec})
+    person = CodecPerson()
+    person.contact = Contact("a@example.com")
+    person.extra = {"__class__": "x", "nested": {"__class__": None, "n": Contact()}}
+    person.commit()
+    Flexmeta.flextable_objects.clear()
+    Flexmeta.flextable_selects.clear()
+    person = CodecPerson().select().fetch_one()
+
+    assert person.extra["__class__"] == "x"
+    assert person.extra["nested"]["__class__"] is None
+    assert type(person.extra["nested"]["n"]) is Contact
+    assert person.contact.mail == "a@example.com"
+
+
+def person_class(config: str) -> type[Person]:
+    return type(
+        f"{config.title()}Person",
+        (Person,),
+        {"table": config, "options": CONFIGS[config]},
+    )
+
+
+def run_queries(klass: type[Person]) -> dict[str, Any]:
+    """Returns the results of the same queries, compared between the configs"""
+    results: dict[str, Any] = {}
+
+    def ids(select: Flextable.Flexselect) -> list[int]:
+        return [person.id for person in select.fetch_all()]
+
+    for n, (where, _) in enumerate(QUERIES):
+        select = klass().select()
+        select.where(where(select))
+        results[f"where {n}"] = sorted(ids(select))
+
+    select = klass().select()
+    select.where(select.name == "p5")
+    select.where(select.year >= 5)
+    results["and"] = sorted(ids(select))
+    select = klass().select()
+    select.where(select.year.is_between((2, 6)))
+    results["between"] = sorted(ids(select))
+    results["sort"] = ids(klass().select().sort("name").sort("year", True))
+    results["top"] = ids(klass().select().sort("year").limit(7))
+    page = klass().select().sort("year", True).limit(5).fetch_all()
+    after = (page[-1].year, page[-1].id)
+    results["page"] = ids(klass().select().sort("year", True).limit(5, after))
+    results["count"] = klass().select().count()
+    # the rows of a partitioned table are read by partition, the ties are sorted by id first
+    results["first"] = klass().select().sort("id").sort("name", True).fetch_one().id
+    grouping = klass().select().group_by("year")
+    results["groups"] = sorted(
+        (group["year"], group["total"], group["first"], group["names"])
+        for group in grouping.agg(
+            total="count", first=("min", "id"), names=("count_distinct", "name")
+        )
+    )
+
+    return results
+
+
+def test_configs_return_the_same_results():
+    results = {}
+
+    for config in CONFIGS:
+        klass = person_class(config)
+
+        for i in range(200):
+            person = klass()
+            person.name = f"p{i % 13}"
+            person.year = i % 10
+            person.commit()
+
+        klass().select().fetch_all()
+        select = klass().select()
+        select.where(select.year == 2)
+
+        for person in select.fetch_all():
+            person.year = 12 if person.id % 2 else person.year
+            person.commit()
+
+        select = klass().select()
+        select.where(select.year == 4)
+
+        for person in select.fetch_all()[::3]:
+            person.delete()
+
+        Flexmeta.flextable_selects.clear()
+        results[config] = run_queries(klass)
+
+    assert results["pickle"]["count"] == 193
+
+    for config in CONFIGS:
+        assert results[config] == results["pickle"], config
+
+
+def update(config: str, owner: int) -> list[int]:
+    klass, r = person_class(config), random.Random(owner)
+    ids = []
+
+    for _ in range(5):
+        person = klass()
+        person.name = f"owner {owner}"
+        person.commit()
+        ids.append(person.id)
+
+    for step in range(60):
+        person = klass().flexmeta.load_object(r.choice(ids))
+        person.year += 1
+        person.commit()
+
+        if step % 10 == 0:
+            klass().select().fetch_all()
+
+    return ids
+
+
+@fork
+@pytest.mark.parametrize("config", ["segment", "columnar"])
+def test_concurrent_writers_keep_every_update(config: str):
+    klass = person_class(config)
+    klass().select().fetch_all()
+
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        owners = pool.starmap(update, [(config, owner) for owner in range(4)])
+
+    Flexmeta.flextable_selects.clear()
+    persons = klass().select().fetch_all()
+
+    assert sorted(person.id for person in persons) == sorted(sum(owners, []))
+    assert sum(person.year for person in persons) == 240
+
+    for owner, ids in enumerate(owners):
+        select = klass().select()
+        select.where(select.name == f"owner {owner}")
+        assert sorted(person.id for person in select.fetch_all()) == sorted(ids)